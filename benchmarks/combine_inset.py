@@ -0,0 +1,87 @@
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Compare the time and peak memory of creating combined images with the
+# secondary image decoded at full size (before) and at reduced size (after).
+# Every mode runs in its own process, since peak RSS can only go up.
+#
+# Usage: python benchmarks/combine_inset.py [--images 20] [--format webp|jpeg]
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from bereal_toolkit.imaging import ImageCompositor, load_image  # noqa: E402
+from run_benchmarks import peak_rss_mb  # noqa: E402
+from synthetic_export import IMAGE_SIZE, create_image  # noqa: E402
+
+SUFFIXES = {'webp': '.webp', 'jpeg': '.jpg'}
+
+
+# Function to get the paths of the primary/secondary pairs in a folder
+def image_pairs(folder, count, image_format):
+    suffix = SUFFIXES[image_format]
+    return [(Path(folder) / f"primary_{i}{suffix}", Path(folder) / f"secondary_{i}{suffix}") for i in range(count)]
+
+
+# Function to create photo-like test images of the size BeReal exports
+def create_images(folder, count, image_format, seed=0):
+    rng = random.Random(seed)
+    pairs = image_pairs(folder, count, image_format)
+    for paths in pairs:
+        for path in paths:
+            create_image(IMAGE_SIZE, rng).save(path, image_format.upper(), quality=80)
+    return pairs
+
+
+def run_mode(mode, pairs):
+    if mode == 'before':
+        compositor = ImageCompositor(reducing_gap=None)
+    else:
+        compositor = ImageCompositor()
+
+    timings = []
+    for primary_path, secondary_path in pairs:
+        start = time.perf_counter()
+        primary_image = load_image(primary_path)
+        if mode == 'before':
+            compositor.combine(primary_image, load_image(secondary_path))
+        else:
+            compositor.combine_inset(primary_image, compositor.load_secondary(secondary_path))
+        timings.append(time.perf_counter() - start)
+
+    return {'mode': mode, 'ms_per_composite': 1000 * sum(timings) / len(timings), 'peak_rss_mb': peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark combined image creation with reduced-size decoding.")
+    parser.add_argument('--images', type=int, default=20, help="Number of primary/secondary pairs")
+    parser.add_argument('--format', choices=sorted(SUFFIXES), default='webp', help="Format of the source images")
+    parser.add_argument('--mode', choices=['before', 'after'], help=argparse.SUPPRESS)
+    parser.add_argument('--folder', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, image_pairs(args.folder, args.images, args.format))))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        create_images(folder, args.images, args.format)
+        print(f"{args.images} composites from {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} {args.format} images")
+        print(f"{'mode':<8} {'ms/composite':>12} {'peak RSS (MB)':>14}")
+        for mode in ('before', 'after'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--folder', folder, '--images', str(args.images), '--format', args.format],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<8} {result['ms_per_composite']:>12.1f} {result['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Compare the encoder presets on the same images
+# All images of a synthetic export (or a real one with --export) are decoded
+# once, then encoded with every preset including metadata. The lossless preset
+# keeps the WebP files, so for it adding the metadata to the file is timed.
+# Prints ms and bytes per image for every preset and saves them as JSON.
+#
+# Usage: python benchmarks/encoder_presets.py [--posts 10] [--presets fast archive ...]
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from bereal_toolkit.encoders import PRESETS, get_encoder  # noqa: E402
+from bereal_toolkit.imaging import load_image, tag_webp  # noqa: E402
+from bereal_toolkit.metrics import collect, summarize  # noqa: E402
+from bereal_toolkit.posts import iter_posts, resolve_entry  # noqa: E402
+from bereal_toolkit.sources import open_export, read_source  # noqa: E402
+from run_benchmarks import git_commit  # noqa: E402
+from synthetic_export import create_synthetic_export  # noqa: E402
+
+
+# Function to decode all images of an export, with the metadata of their post
+def load_images(export_dir):
+    export = open_export(export_dir)
+    images = []
+    with export.open_posts() as posts_file:
+        for entry in iter_posts(posts_file):
+            task = resolve_entry(entry, export)
+            for path in task['sources'].values():
+                data = read_source(path)
+                images.append((data, load_image(path), task['taken_at'], task['location'], task['caption']))
+    return images
+
+
+# Function to encode all images with one encoder
+def run_preset(encoder, images):
+    timings = []
+    sizes = []
+    for data, img, taken_at, location, caption in images:
+        start = time.perf_counter()
+        if encoder.keep_source:
+            output = tag_webp(data, taken_at, location, caption)
+        else:
+            output = encoder.encode(img, taken_at, location, caption)
+        timings.append(time.perf_counter() - start)
+        sizes.append(len(output))
+    summary = summarize(timings)
+    return {
+        'format': encoder.format,
+        'options': encoder.options,
+        'ms_per_image': summary['mean_ms'],
+        'p95_ms': summary['p95_ms'],
+        'bytes_per_image': sum(sizes) / len(sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare encode time and size of the encoder presets.")
+    parser.add_argument('--posts', type=int, default=10, help="Number of posts in the synthetic export (default: 10)")
+    parser.add_argument('--export', help="Use this export instead of creating a synthetic one")
+    parser.add_argument('--presets', nargs='+', choices=list(PRESETS), default=list(PRESETS), help="Presets to compare (default: all)")
+    parser.add_argument('--output', help="JSON file for the results (default: benchmarks/results/encoders-<date>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    commit = git_commit()
+
+    with tempfile.TemporaryDirectory() as folder, collect():
+        export_dir = Path(args.export) if args.export else create_synthetic_export(Path(folder) / 'export', args.posts)
+        images = load_images(export_dir)
+
+        source_bytes = sum(len(data) for data, *_ in images) / len(images)
+        print(f"{len(images)} images of {images[0][1].width}x{images[0][1].height}, {source_bytes / 1000:.0f} KB per WebP source")
+        print(f"{'preset':<10} {'format':<6} {'ms/image':>9} {'p95 ms':>9} {'KB/image':>9}")
+        results = {}
+        for preset in args.presets:
+            try:
+                encoder = get_encoder(preset)
+            except ValueError as e:
+                print(f"{preset:<10} skipped: {e}")
+                continue
+            result = results[preset] = run_preset(encoder, images)
+            print(f"{preset:<10} {encoder.format:<6} {result['ms_per_image']:>9.1f} {result['p95_ms']:>9.1f} {result['bytes_per_image'] / 1000:>9.0f}")
+
+    output = Path(args.output) if args.output else BENCHMARK_DIR / 'results' / f"encoders-{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding="utf8") as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'images': len(images),
+            'source_bytes_per_image': source_bytes,
+            'presets': results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
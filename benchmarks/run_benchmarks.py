@@ -0,0 +1,200 @@
+import argparse
+import io
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import PIL
+from PIL import Image
+
+# Benchmark suite for the toolkit
+# A synthetic export is created (see synthetic_export.py) and every stage of
+# processing an image is timed on its own: reading the source, WebP decode,
+# building EXIF and IPTC data, JPEG encode, writing the output and combining.
+# After that the whole export is processed with process_export to measure
+# images per second end to end. Results are printed and saved as JSON, so
+# runs can be compared with --baseline to spot regressions.
+#
+# Usage: python benchmarks/run_benchmarks.py [--posts 20] [--jobs 1] [--output results.json] [--baseline old.json]
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from bereal_toolkit import Options, process_export  # noqa: E402
+from bereal_toolkit.files import write_file_atomic  # noqa: E402
+from bereal_toolkit.imaging import compositor  # noqa: E402
+from bereal_toolkit.metrics import collect, summarize  # noqa: E402
+from bereal_toolkit.metadata import build_exif, build_iptc_segment, _insert_jpeg_segment  # noqa: E402
+from bereal_toolkit.posts import iter_posts, resolve_entry  # noqa: E402
+from bereal_toolkit.sources import open_export, open_source  # noqa: E402
+from synthetic_export import create_synthetic_export  # noqa: E402
+
+STAGES = ['read', 'decode', 'exif', 'iptc', 'encode', 'write', 'combine']
+
+
+# Function to get the peak RSS in MB of this process or of its finished children
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return peak_rss / 1024
+
+
+# Function to time every stage of processing the images of an export
+# The stages follow process_entry with the default settings: both images are
+# converted to JPEG with metadata and combined.
+def run_stages(export_dir, output_dir):
+    export = open_export(export_dir)
+    timings = {stage: [] for stage in STAGES}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[stage].append(time.perf_counter() - start)
+        return result
+
+    def read(path):
+        with open_source(path) as f:
+            return f.read()
+
+    def decode(data):
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            return img if img.mode == 'RGB' else img.convert('RGB')
+
+    def encode(img, exif_bytes, iptc_segment):
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=80, exif=exif_bytes)
+        return _insert_jpeg_segment(buffer.getvalue(), iptc_segment)
+
+    images = 0
+    image_size = None
+    # The toolkit's own stage metrics are collected apart, they are not part of the results
+    with export.open_posts() as posts_file, collect():
+        for index, entry in enumerate(iter_posts(posts_file)):
+            task = resolve_entry(entry, export)
+            decoded = {}
+            for role, path in task['sources'].items():
+                data = timed('read', read, path)
+                decoded[role] = timed('decode', decode, data)
+                exif_bytes = timed('exif', build_exif, task['taken_at'], task['location'], task['caption'])
+                iptc_segment = timed('iptc', build_iptc_segment, task['caption'])
+                jpeg_data = timed('encode', encode, decoded[role], exif_bytes, iptc_segment)
+                timed('write', write_file_atomic, Path(output_dir) / f"{index}_{role}.jpg", jpeg_data)
+                images += 1
+            timed('combine', compositor.combine, decoded['primary'], decoded['secondary'])
+            image_size = image_size or decoded['primary'].size
+
+    return images, image_size, {stage: summarize(values) for stage, values in timings.items()}
+
+
+# Function to process the whole export and measure images per second
+# The stages are taken from the run metrics of process_export, so with more
+# than one job they show the timings inside the workers.
+def run_end_to_end(export_dir, output_dir, jobs):
+    start = time.perf_counter()
+    stats = process_export(export_dir, output_dir, Options(jobs=jobs, force=True))
+    seconds = time.perf_counter() - start
+    return {
+        'jobs': jobs,
+        'seconds': seconds,
+        'images_per_sec': stats.processed / seconds if seconds else 0.0,
+        'bytes_read': stats.metrics.bytes_read,
+        'bytes_written': stats.metrics.bytes_written,
+        'stats': stats.as_dict(),
+        'stages': stats.metrics.stage_summary(),
+    }
+
+
+# Function to get the current commit of the repository, if any
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to print the results, with the change against a baseline if given
+def print_results(results, baseline=None):
+    print(f"{results['posts']} posts, {results['images']} images of {results['image_size'][0]}x{results['image_size'][1]}")
+    header = f"{'stage':<8} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}"
+    print(header + (f" {'p50 vs base':>12}" if baseline else ""))
+    for stage, summary in results['stages'].items():
+        line = f"{stage:<8} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['mean_ms']:>9.2f}"
+        base = (baseline or {}).get('stages', {}).get(stage)
+        if base and base['p50_ms']:
+            line += f" {100 * (summary['p50_ms'] / base['p50_ms'] - 1):>+11.1f}%"
+        print(line)
+
+    end_to_end = results['end_to_end']
+    line = f"End to end with {end_to_end['jobs']} job(s): {end_to_end['images_per_sec']:.2f} images/sec"
+    if baseline and baseline.get('end_to_end', {}).get('images_per_sec'):
+        line += f" ({100 * (end_to_end['images_per_sec'] / baseline['end_to_end']['images_per_sec'] - 1):+.1f}% vs base)"
+    print(line)
+    print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB (workers: {results['peak_rss_children_mb']:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of processing a BeReal export.")
+    parser.add_argument('--posts', type=int, default=20, help="Number of posts in the synthetic export (default: 20)")
+    parser.add_argument('--jobs', type=int, default=1, help="Worker processes for the end-to-end run (default: 1)")
+    parser.add_argument('--export', help="Use this export instead of creating a synthetic one")
+    parser.add_argument('--output', help="JSON file for the results (default: benchmarks/results/<date>.json)")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    # The per-line logging would be part of every timing otherwise
+    logging.basicConfig(level=logging.WARNING)
+    # Collected before any images are loaded, git and uname would otherwise count as large child processes
+    environment = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        folder = Path(folder)
+        export_dir = Path(args.export) if args.export else create_synthetic_export(folder / 'export', args.posts)
+
+        (folder / 'stages').mkdir()
+        images, image_size, stages = run_stages(export_dir, folder / 'stages')
+        end_to_end = run_end_to_end(export_dir, folder / 'end_to_end', args.jobs)
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        **environment,
+        'posts': images // 2,
+        'images': images,
+        'image_size': image_size,
+        'stages': stages,
+        'end_to_end': end_to_end,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_children_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = Path(args.output) if args.output else BENCHMARK_DIR / 'results' / f"{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding="utf8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
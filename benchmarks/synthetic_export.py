@@ -0,0 +1,78 @@
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+# Generator for synthetic BeReal exports, used by the benchmarks
+# The layout matches a real export: posts.json next to Photos/post with one
+# primary and one secondary WebP image per post. Images are photo-like
+# (gradients plus noise) so they decode and encode like real photos.
+#
+# Usage: python benchmarks/synthetic_export.py OUTPUT_FOLDER [--posts 20]
+
+IMAGE_SIZE = (1500, 2000)
+
+
+# Function to create one photo-like image
+# Smooth gradients give the colours and a layer of noise gives the detail, so
+# the WebP files end up in the size range of real BeReal photos.
+def create_image(size, rng):
+    width, height = size
+    shift = (rng.randrange(-width // 4, width // 4), rng.randrange(-height // 4, height // 4))
+    bands = [
+        Image.linear_gradient('L').resize(size).rotate(rng.randrange(360)),
+        Image.radial_gradient('L').resize(size).transform(size, Image.Transform.AFFINE, (1, 0, shift[0], 0, 1, shift[1])),
+        Image.linear_gradient('L').resize(size).transpose(Image.Transpose.ROTATE_180),
+    ]
+    base = Image.merge('RGB', rng.sample(bands, 3))
+    noise = Image.merge('RGB', [Image.effect_noise(size, rng.uniform(20, 40)) for _ in range(3)])
+    return Image.blend(base, noise, rng.uniform(0.15, 0.3))
+
+
+# Function to create a synthetic export with the given number of posts
+# Every other post has a location and every third post a caption, and some
+# posts share the same second to exercise filename deduplication.
+def create_synthetic_export(export_dir, posts=20, size=IMAGE_SIZE, seed=0):
+    rng = random.Random(seed)
+    export_dir = Path(export_dir)
+    photo_folder = export_dir / 'Photos' / 'post'
+    photo_folder.mkdir(parents=True, exist_ok=True)
+
+    taken_at = datetime(2023, 1, 1, 12, 0, 0)
+    entries = []
+    for i in range(posts):
+        entry = {'takenAt': taken_at.strftime("%Y-%m-%dT%H:%M:%S.") + f"{rng.randrange(1000):03d}Z"}
+        for role in ('primary', 'secondary'):
+            filename = f"{rng.getrandbits(64):016x}-{role}.webp"
+            create_image(size, rng).save(photo_folder / filename, 'WEBP', quality=80)
+            entry[role] = {'path': f"/Photos/post/{filename}", 'width': size[0], 'height': size[1]}
+        if i % 2 == 0:
+            entry['location'] = {'latitude': rng.uniform(-60, 60), 'longitude': rng.uniform(-180, 180)}
+        if i % 3 == 0:
+            entry['caption'] = f"Synthetic post {i}"
+        entries.append(entry)
+
+        # Every fifth post is a retake in the same second
+        if i % 5 != 4:
+            taken_at += timedelta(hours=rng.randrange(1, 48), seconds=rng.randrange(60))
+
+    with open(export_dir / 'posts.json', 'w', encoding="utf8") as f:
+        json.dump(entries, f, indent=2)
+    return export_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a synthetic BeReal export for benchmarks.")
+    parser.add_argument('output', help="Folder for the export")
+    parser.add_argument('--posts', type=int, default=20, help="Number of posts (default: 20)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+    create_synthetic_export(args.output, args.posts, seed=args.seed)
+    print(f"Created synthetic export with {args.posts} posts in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
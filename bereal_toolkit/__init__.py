@@ -0,0 +1,12 @@
+"""Convert, rename and tag the photos of a BeReal GDPR export.
+
+    from bereal_toolkit import Options, process_export
+
+    stats = process_export('path/to/export', options=Options(jobs=4))
+"""
+
+from .export import ExportFolders, Options, Stats, process_export
+from .imaging import BatchCompositor, ImageCompositor
+from .recombine import recombine_export
+
+__all__ = ['BatchCompositor', 'ExportFolders', 'ImageCompositor', 'Options', 'Stats', 'process_export', 'recombine_export']
@@ -0,0 +1,297 @@
+import argparse
+import cProfile
+import logging
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from .encoders import PRESETS
+from .export import ExportFolders, Options, process_export
+from .index import count_images
+from .recombine import recombine_export
+from .sources import DirectoryExport, open_export
+
+# ANSI escape codes for text styling
+STYLING = {
+    "GREEN": "\033[92m",
+    "RED": "\033[91m",
+    "BLUE": "\033[94m",
+    "BOLD": "\033[1m",
+    "RESET": "\033[0m",
+}
+
+#Setup log styling
+class ColorFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno == logging.INFO and "Finished processing" not in record.msg:
+            message = STYLING["GREEN"] + message + STYLING["RESET"]
+        elif record.levelno == logging.ERROR:
+            message = STYLING["RED"] + message + STYLING["RESET"]
+        elif "Finished processing" in record.msg:  # Identify the summary message
+            message = STYLING["BLUE"] + STYLING["BOLD"] + message + STYLING["RESET"]
+        return message
+
+# Function to setup logging with styling
+def setup_logging(level=logging.INFO):
+    logging.basicConfig(level=level)
+    logger = logging.getLogger()
+    handler = logger.handlers[0]  # Get the default handler installed by basicConfig
+    handler.setFormatter(ColorFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+# Function to format a duration in seconds as e.g. 1h02m or 3m05s
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{seconds:02d}s"
+
+# Function to parse a day given on the command line
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, use YYYY-MM-DD")
+
+# Progress line with the estimated remaining time
+# The line is redrawn in place on stderr, at most five times a second.
+class ProgressDisplay:
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.start = time.perf_counter()
+        self._last_draw = 0.0
+
+    def __call__(self, done, total):
+        now = time.perf_counter()
+        if now - self._last_draw < 0.2 and done < total:
+            return
+        self._last_draw = now
+        elapsed = now - self.start
+        remaining = elapsed / done * (total - done) if done else 0.0
+        percent = 100 * done / total if total else 100
+        self.stream.write(f"\rProcessed {done}/{total} entries ({percent:.0f}%), elapsed {_format_duration(elapsed)}, remaining {_format_duration(remaining)}  ")
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write("\n")
+        self.stream.flush()
+
+# Function to ask a yes/no question until it is answered
+def _ask_yes_no(question):
+    answer = None
+    while answer not in ['yes', 'no']:
+        answer = input(question).strip().lower()
+        if answer not in ['yes', 'no']:
+            logging.error("Invalid input. Please enter 'yes' or 'no'.")
+    return answer == 'yes'
+
+# Function to ask for the settings interactively
+def ask_settings(options):
+    ## Initial choice for accessing advanced settings
+    print(STYLING["BOLD"] + "\nDo you want to access advanced settings or run with default settings?" + STYLING["RESET"])
+    print("Default settings are:\n"
+    "1. Copied images are converted from WebP to JPEG\n"
+    "2. Converted images' filenames do not contain the original filename\n"
+    "3. Combined images are created from the original primary and secondary images")
+    advanced_settings = input("\nEnter " + STYLING["BOLD"] + "'yes'" + STYLING["RESET"] + "for advanced settings or press any key to continue with default settings: ").strip().lower()
+
+    if advanced_settings != 'yes':
+        print("Continuing with default settings.\n")
+        return options
+
+    # User choice for converting to JPEG
+    options.convert_to_jpeg = _ask_yes_no(STYLING["BOLD"] + "\n1. Do you want to convert images from WebP to JPEG? (yes/no): " + STYLING["RESET"])
+    if not options.convert_to_jpeg:
+        print("Your images will not be converted. No additional metadata will be added.")
+
+    # User choice for keeping original filename
+    print(STYLING["BOLD"] + "\n2. There are two options for how output files can be named" + STYLING["RESET"] + "\n"
+    "Option 1: YYYY-MM-DDTHH-MM-SS_primary/secondary_original-filename.jpeg\n"
+    "Option 2: YYYY-MM-DDTHH-MM-SS_primary/secondary.jpeg\n"
+    "This will only influence the naming scheme of singular images.")
+    options.keep_original_filename = _ask_yes_no(STYLING["BOLD"] + "Do you want to keep the original filename in the renamed file? (yes/no): " + STYLING["RESET"])
+
+    # User choice for creating combined images
+    options.create_combined_images = _ask_yes_no(STYLING["BOLD"] + "\n3. Do you want to create combined images like the original BeReal memories? (yes/no): " + STYLING["RESET"])
+    return options
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert, rename and tag the photos of a BeReal GDPR export.")
+    parser.add_argument("export_dir", nargs="?", default=".",
+                        help="Folder of the unzipped export with posts.json and the Photos folder (default: current folder)")
+    parser.add_argument("-o", "--output-dir",
+                        help="Folder for the __processed and __combined output folders (default: Photos/post inside the export)")
+    parser.add_argument("--no-convert", dest="convert_to_jpeg", action="store_false", default=None,
+                        help="Copy images as WebP instead of converting them to JPEG")
+    parser.add_argument("--keep-original-filename", action="store_true", default=None,
+                        help="Keep the original filename in the renamed file")
+    parser.add_argument("--no-combined", dest="create_combined_images", action="store_false", default=None,
+                        help="Do not create combined images")
+    parser.add_argument("--encoder", choices=list(PRESETS), default="fast",
+                        help="Encoder preset for converted and combined images: fast (default, JPEG), archive (smaller "
+                             "progressive JPEG, slower), lossless (keep the WebP images), webp or avif")
+    parser.add_argument("--quality", type=int,
+                        help="Quality of the encoder (default: 80 for JPEG and WebP, 60 for AVIF). For the lossless preset this is the compression effort (default: 0)")
+    parser.add_argument("--subsampling", choices=["4:4:4", "4:2:2", "4:2:0"],
+                        help="Chroma subsampling of JPEG images (default: 4:2:0)")
+    parser.add_argument("--link", choices=["copy", "hardlink", "reflink"], default="copy",
+                        help="How images that are not converted are put into the output folder: copied (default), "
+                             "hard-linked or cloned (reflink). Falls back to copying where the file system does not support it")
+    parser.add_argument("--webp-metadata", choices=["none", "embed", "sidecar"], default="none",
+                        help="Metadata for images that stay WebP: none (default), embedded as EXIF and XMP without re-encoding, "
+                             "or written to .xmp sidecar files, which keeps --link working")
+    parser.add_argument("--previews", type=int, nargs="*", metavar="SIZE",
+                        help="Also make WebP previews of every output image with these longest sides in pixels "
+                             "(default without sizes: 256 1024) and a catalog of all posts in the __previews folder")
+    parser.add_argument("-y", "--non-interactive", action="store_true",
+                        help="Do not ask for settings, use the defaults and the given options")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes used for converting images (0 uses all CPU cores, default: 1)")
+    parser.add_argument("--prefetch", type=int, default=4, metavar="N",
+                        help="Number of entries whose images are read ahead, and of output files queued for writing, "
+                             "while images are converted (default: 4, 0 to do one step after the other)")
+    parser.add_argument("--recombine", action="store_true",
+                        help="Only render the combined images of already processed entries again, e.g. after changing "
+                             "the style in ImageCompositor. The singular images are left as they are")
+    parser.add_argument("--since", type=_parse_date, metavar="YYYY-MM-DD",
+                        help="Only process posts taken on or after this day (UTC)")
+    parser.add_argument("--until", type=_parse_date, metavar="YYYY-MM-DD",
+                        help="Only process posts taken on or before this day (UTC)")
+    parser.add_argument("--day", type=_parse_date, metavar="YYYY-MM-DD",
+                        help="Only process posts taken on this day (UTC), the same as --since and --until with the same day")
+    parser.add_argument("--only-with-location", action="store_true",
+                        help="Only process posts that have a location")
+    parser.add_argument("--no-index", dest="use_index", action="store_false",
+                        help="Read posts.json and scan the image folders on every run instead of keeping an index of the posts "
+                             "in the output folder (posts-index.sqlite)")
+    parser.add_argument("--force", action="store_true",
+                        help="Process all entries again, even if the manifest lists them as unchanged")
+    parser.add_argument("--log-level", choices=["debug", "info", "warning", "error"], default="info",
+                        help="Which messages to log (default: info, one line per step). Above info a progress line is shown instead")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Where to write the JSON run report (default: run-report.json in the output folder)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+                        help="Profile the run with cProfile and save the stats (default: run-profile.pstats in the output folder). "
+                             "With --jobs only the main process is profiled")
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 or a positive number")
+    if args.day is not None:
+        if args.since is not None or args.until is not None:
+            parser.error("--day can not be combined with --since or --until")
+        args.since = args.until = args.day
+    if args.since is not None and args.until is not None and args.since > args.until:
+        parser.error("--since must not be after --until")
+    if args.previews is not None:
+        args.previews = tuple(sorted(set(args.previews or [256, 1024])))
+        if any(size <= 0 for size in args.previews):
+            parser.error("--previews sizes must be positive")
+    if args.prefetch < 0:
+        parser.error("--prefetch must be 0 or a positive number")
+    if args.quality is not None and not 0 <= args.quality <= 100:
+        parser.error("--quality must be between 0 and 100")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+# Function to render the combined images again instead of processing the export
+def recombine(args, log_level):
+    progress = ProgressDisplay() if log_level > logging.INFO and sys.stderr.isatty() else None
+    try:
+        stats = recombine_export(args.export_dir, args.output_dir, progress=progress, prefetch=args.prefetch,
+                                 since=args.since, until=args.until, only_with_location=args.only_with_location)
+    except FileNotFoundError as e:
+        logging.error(f"JSON file not found. Please check the path. ({e})")
+        sys.exit(1)
+    finally:
+        if progress is not None:
+            progress.finish()
+    logging.info(f"Finished rendering combined images.\nFiles combined: {stats.combined}\nFiles skipped: {stats.skipped}\nDuration: {_format_duration(stats.seconds)}")
+    if log_level > logging.INFO:
+        print(f"Rendered {stats.combined} combined images in {_format_duration(stats.seconds)}, {stats.skipped} skipped.")
+
+def main(argv=None):
+    args = parse_args(argv)
+    log_level = getattr(logging, args.log_level.upper())
+    setup_logging(log_level)
+
+    options = Options(jobs=args.jobs, force=args.force, prefetch=args.prefetch, link=args.link, webp_metadata=args.webp_metadata,
+                      encoder=args.encoder, quality=args.quality, subsampling=args.subsampling,
+                      since=args.since, until=args.until, only_with_location=args.only_with_location, use_index=args.use_index,
+                      previews=args.previews or ())
+    try:
+        options.get_encoder()
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(2)
+    setting_flags = {
+        'convert_to_jpeg': args.convert_to_jpeg,
+        'keep_original_filename': args.keep_original_filename,
+        'create_combined_images': args.create_combined_images,
+    }
+    for name, value in setting_flags.items():
+        if value is not None:
+            setattr(options, name, value)
+
+    export = open_export(args.export_dir)
+    folders = ExportFolders.from_dirs(args.export_dir, args.output_dir)
+
+    # Print the paths
+    print(STYLING["BOLD"] + "\nThe following paths are set for the input and output files:" + STYLING["RESET"])
+    if isinstance(export, DirectoryExport):
+        print(f"Photo folder: {export.photo_folder}")
+        if os.path.exists(export.bereal_folder):
+            print(f"Older photo folder: {export.bereal_folder}")
+    else:
+        print(f"Export archive: {export}")
+    print(f"Output folder for singular images: {folders.output_folder}")
+    print(f"Output folder for combined images: {folders.output_folder_combined}")
+    print("")
+
+    image_counts = count_images(export, folders.output_folder) if args.use_index else export.count_images()
+    for folder, number_of_files in image_counts.items():
+        print(f"Number of WebP-files in {folder}: {number_of_files}")
+
+    if args.recombine:
+        recombine(args, log_level)
+        return
+
+    # Settings are only asked for when running in a terminal without any of the setting options
+    interactive = not args.non_interactive and sys.stdin.isatty() and all(value is None for value in setting_flags.values())
+    if interactive:
+        ask_settings(options)
+
+    if not options.convert_to_jpeg and not options.create_combined_images and options.webp_metadata == 'none':
+        print("You chose not to convert images nor do you want to output combined images.\n"
+        "The script will therefore only copy images to a new folder and rename them according to your choice without adding metadata or creating new files.\n")
+
+    # The progress line would be torn apart by the per-step log lines
+    progress = ProgressDisplay() if log_level > logging.INFO and sys.stderr.isatty() else None
+    profiler = cProfile.Profile() if args.profile is not None else None
+
+    try:
+        if profiler is not None:
+            stats = profiler.runcall(process_export, args.export_dir, args.output_dir, options, progress, args.report)
+        else:
+            stats = process_export(args.export_dir, args.output_dir, options, progress, args.report)
+    except FileNotFoundError as e:
+        logging.error(f"JSON file not found. Please check the path. ({e})")
+        sys.exit(1)
+    finally:
+        if progress is not None:
+            progress.finish()
+
+    if profiler is not None:
+        profile_path = Path(args.profile) if args.profile else folders.output_folder / 'run-profile.pstats'
+        profiler.dump_stats(profile_path)
+        print(f"Profile saved to {profile_path}, view it with: python -m pstats {profile_path}")
+
+    # Summary
+    images_per_sec = stats.processed / stats.seconds if stats.seconds else 0.0
+    report_path = args.report or folders.output_folder / 'run-report.json'
+    logging.info(f"Finished processing.\nNumber of input-files: {stats.input_files}\nTotal files processed: {stats.processed}\nFiles converted: {stats.converted}\nFiles skipped: {stats.skipped}\nFiles combined: {stats.combined}\nEntries unchanged since last run: {stats.unchanged}\nEntries with updated previews: {stats.previews_updated}\nDuplicate entries skipped: {stats.duplicates} ({stats.duplicate_bytes / 1e6:.1f} MB, {_format_duration(stats.saved_seconds)} saved)\nDuration: {_format_duration(stats.seconds)} ({images_per_sec:.1f} images/sec)\nRun report: {report_path}")
+    if log_level > logging.INFO:
+        print(f"Processed {stats.processed} files in {_format_duration(stats.seconds)}, {stats.skipped} skipped, {stats.duplicates} duplicates. Run report: {report_path}")
@@ -0,0 +1,791 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field, fields
+from datetime import date, datetime
+from pathlib import Path
+
+from . import metrics
+from .encoders import get_encoder
+from .files import FolderLock, NameRegistry, release_placeholder, write_file_atomic
+from .imaging import combine_images_with_resizing, compositor, convert_webp_to_jpg, build_xmp_sidecar, encode_webp, load_image, tag_webp
+from .manifest import build_content_index, content_key, entry_is_unchanged, load_manifest, save_manifest, size_key
+from .metrics import Metrics
+from .pipeline import OutputWriter, prefetch_tasks
+from .previews import CATALOG_NAME, describe_renditions, make_renditions, recorded_sizes, remove_unused_folders, rendition_path, write_catalog
+from .index import open_posts_index, select_posts
+from .sources import copy_source, open_export, read_source, source_fingerprint, source_hash, source_stat
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Options:
+    """Settings for processing an export, the defaults match the default settings of the script."""
+    convert_to_jpeg: bool = True  # Convert images from WebP to JPEG (or the format of the encoder) and add metadata
+    keep_original_filename: bool = False  # Keep the original filename in the renamed file
+    create_combined_images: bool = True  # Create combined images like the original BeReal memories
+    jobs: int = 1  # Number of worker processes
+    force: bool = False  # Process entries again even if the manifest lists them as unchanged
+    link: str = 'copy'  # How images that are not converted are put into the output folder: 'copy', 'hardlink' or 'reflink'
+    webp_metadata: str = 'none'  # Metadata for WebP outputs: 'none', 'embed' (EXIF and XMP chunks) or 'sidecar' (.xmp files)
+    encoder: str = 'fast'  # Encoder preset for converted and combined images, see encoders.PRESETS
+    quality: int = None  # Quality of the encoder, None for the default of the preset
+    subsampling: str = None  # JPEG chroma subsampling ('4:4:4', '4:2:2' or '4:2:0'), None for the default of the preset
+    prefetch: int = 4  # Entries read ahead and outputs queued for writing, 0 to read, process and write one after the other
+    since: date = None  # Only process posts taken on or after this day (UTC)
+    until: date = None  # Only process posts taken on or before this day (UTC)
+    only_with_location: bool = False  # Only process posts with a location
+    use_index: bool = True  # Keep the posts of the export in an index in the output folder, see index.py
+    previews: tuple = ()  # Longest sides of the WebP previews made of every output image, e.g. (256, 1024), see previews.py
+
+    # Function to get the settings that change the outputs, these are stored in the manifest
+    # Newer settings are only listed if they are not at their default, so
+    # manifests written by older versions stay valid. The previews are not
+    # listed, adding or removing them leaves the outputs as they are.
+    def output_settings(self):
+        settings = {
+            'convert_to_jpeg': self.convert_to_jpeg,
+            'keep_original_filename': self.keep_original_filename,
+            'create_combined_images': self.create_combined_images,
+        }
+        if self.webp_metadata != 'none':
+            settings['webp_metadata'] = self.webp_metadata
+        if self.encoder != 'fast':
+            settings['encoder'] = self.encoder
+        if self.quality is not None:
+            settings['quality'] = self.quality
+        if self.subsampling is not None:
+            settings['subsampling'] = self.subsampling
+        return settings
+
+    # Function to get the encoder for converted and combined images
+    def get_encoder(self):
+        return get_encoder(self.encoder, self.quality, self.subsampling)
+
+
+@dataclass
+class Stats:
+    """Counters of one processed export."""
+    input_files: int = 0
+    processed: int = 0
+    converted: int = 0
+    skipped: int = 0
+    combined: int = 0
+    unchanged: int = 0
+    previews_updated: int = 0  # Unchanged entries whose previews were added or removed
+    duplicates: int = 0  # Entries skipped because an entry with the same images and metadata was processed before
+    duplicate_bytes: int = 0  # Size of the source images of the skipped duplicates
+    saved_seconds: float = 0.0  # Processing time the duplicates took when they were processed first
+    seconds: float = 0.0  # Duration of the run
+    metrics: Metrics = field(default_factory=Metrics, repr=False)  # Stage timings, bytes and entry outcomes
+
+    # Function to get the counters as a dict, without the metrics
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'metrics'}
+
+
+@dataclass
+class ExportFolders:
+    """Output folders of an export."""
+    output_folder: Path
+    output_folder_combined: Path
+    previews_folder: Path
+
+    # Function to derive the folders from the export and output directory
+    # Without an output directory, the outputs go to Photos/post/__processed,
+    # Photos/post/__combined and Photos/post/__previews inside the unzipped
+    # export. For an export ZIP
+    # they go to a folder next to it, named like the ZIP without its suffix.
+    # The folders are absolute, like the output paths in the manifest.
+    @classmethod
+    def from_dirs(cls, export_path, output_dir=None):
+        export_path = Path(os.path.abspath(export_path))
+        if output_dir is not None:
+            output_dir = Path(os.path.abspath(output_dir))
+        elif export_path.is_file():
+            output_dir = export_path.with_suffix('')
+        else:
+            output_dir = export_path / 'Photos' / 'post'
+        return cls(
+            output_folder=output_dir / '__processed',
+            output_folder_combined=output_dir / '__combined',
+            previews_folder=output_dir / '__previews',
+        )
+
+
+# Function to get the path of the XMP sidecar written next to an output, None if it gets none
+def sidecar_path(output_path, options):
+    if options.webp_metadata == 'sidecar' and output_path.suffix.lower() == '.webp':
+        return output_path.with_suffix('.xmp')
+    return None
+
+# Function to get the suffixes of the files written next to an output, see NameRegistry.allocate
+def sidecar_suffixes(output_path, options):
+    return ('.xmp',) if sidecar_path(output_path, options) is not None else ()
+
+# Function to write an output and then its XMP sidecar, in the writer thread
+# If the sidecar can not be written, the output is removed again, so an
+# image is never left without its metadata.
+def write_with_sidecar(fn, args, output_path, sidecar, sidecar_data):
+    fn(*args)
+    try:
+        write_file_atomic(sidecar, sidecar_data)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+# Function to plan the output names for one resolved entry
+# This runs in the main process and in input order, so output names stay the
+# same no matter how many workers are used.
+def plan_entry(task, options, folders, registry, reusable=()):
+    # Adjust filename based on user's choice
+    time_str = task['taken_at'].strftime("%Y-%m-%dT%H-%M-%S")  # ISO standard format with '-' instead of ':' for time
+    suffix = options.get_encoder().suffix if options.convert_to_jpeg else '.webp'
+
+    images = []
+    for role, path in task['sources'].items():
+        original_filename_without_extension = path.stem  # Extract original filename without extension
+
+        if options.convert_to_jpeg:
+            if options.keep_original_filename:
+                converted_name = Path(path.name).with_suffix(suffix).name if path.suffix.lower() == '.webp' else path.name
+                new_filename = f"{time_str}_{role}_{converted_name}"
+            else:
+                new_filename = f"{time_str}_{role}{suffix}"
+        else:
+            if options.keep_original_filename:
+                new_filename = f"{time_str}_{role}_{original_filename_without_extension}.webp"
+            else:
+                new_filename = f"{time_str}_{role}.webp"
+
+        new_path = folders.output_folder / new_filename
+        new_path = registry.allocate(new_path, reusable, sidecar_suffixes(new_path, options))  # Ensure the filename is unique
+        images.append((path, role, new_path))
+
+    combined_path = None
+    if options.create_combined_images:
+        combined_path = folders.output_folder_combined / f"{time_str}_combined{suffix}"
+        combined_path = registry.allocate(combined_path, reusable, sidecar_suffixes(combined_path, options))
+
+    task['images'] = images
+    task['combined_path'] = combined_path
+    task['previews_folder'] = folders.previews_folder
+    return task
+
+# Function to get the planned outputs of a task with their sidecars, as strings like in the manifest
+def planned_outputs(task, options):
+    paths = [new_path for _, _, new_path in task['images']] + [task['combined_path']]
+    paths = [path for path in paths if path is not None]
+    return [str(path) for path in paths + [sidecar_path(path, options) for path in paths] if path is not None]
+
+# Function to convert, tag and combine the images of one planned entry
+# Runs in a worker process when more than one job is used. Counters and
+# metrics are returned instead of updated globally and summed up by the main
+# process, together with the manifest record if every output of the entry was
+# written.
+# A duplicate is not processed, its record only points to the entry that
+# holds the outputs.
+def process_entry(task, options, writer=None):
+    return finish_entry(start_entry(task, options, writer))
+
+# Function to do the CPU work of an entry: decode, convert, encode and combine
+# The outputs are handed to `writer` (see pipeline.py) and may still be
+# written when this returns, so the next entry can start in the meantime.
+def start_entry(task, options, writer=None):
+    entry = {'task': task, 'options': options}
+    if 'duplicate_of' in task:
+        return entry
+    start = time.perf_counter()
+    process = _process_previews if task.get('previews_only') else _process_entry
+    with metrics.collect() as entry_metrics:
+        entry['state'] = process(task, options, writer or _worker_writer)
+    task.pop('data', None)  # The prefetched sources are not needed anymore
+    entry['metrics'] = entry_metrics
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+# Function to wait for the outputs of an entry and build its result
+def finish_entry(entry):
+    task, options = entry['task'], entry['options']
+    if 'duplicate_of' in task:
+        return {'counts': {}, 'record': duplicate_record(task, options), 'metrics': Metrics()}
+    start = time.perf_counter()
+    with metrics.collect(entry['metrics']) as entry_metrics:
+        with metrics.stage('write_wait'):
+            result = _finish_entry(task, options, entry['state'])
+    seconds = entry['seconds'] + time.perf_counter() - start
+    outcome = 'processed' if result['record'] is not None else 'failed'
+    if result['record'] is not None and task.get('previews_only'):
+        outcome = 'previews'
+        result['record']['seconds'] = task['previous'].get('seconds', 0.0)  # Time to make the outputs, see add_duplicate
+    elif result['record'] is not None:
+        result['record']['seconds'] = round(seconds, 3)
+    entry_metrics.add_entry(task['index'], task['key'], outcome, seconds)
+    result['metrics'] = entry_metrics
+    return result
+
+# Function to build the manifest record of an entry that duplicates another one
+def duplicate_record(task, options):
+    return {
+        'key': task['key'],
+        'sources': task['fingerprints'],
+        'settings': options.output_settings(),
+        'content': task['content'],
+        'outputs': [],
+        'duplicate_of': task['duplicate_of'],
+    }
+
+def _process_entry(task, options, writer):
+    counts = {'processed': 0, 'converted': 0, 'skipped': 0, 'combined': 0}
+    complete = True
+    taken_at = task['taken_at']
+    location = task['location']
+    caption = task['caption']
+    combined_image_path = task['combined_path']
+    source_data = task.get('data') or {}
+    output_paths = {}
+    sidecar_paths = []
+    decoded_images = {}
+    secondary_is_inset = False
+    encoder = options.get_encoder() if options.convert_to_jpeg else None
+    writes = []  # Queued writes as (future, output paths, counters to take back if the write fails)
+    previews = {}  # Renditions by role, see previews.py
+
+    # Function to queue fn(*args), which writes an output, for the writer
+    # With `with_sidecar`, the XMP sidecar of the output is written after it.
+    def submit(fn, args, output_path, with_sidecar=False):
+        sidecar = sidecar_path(output_path, options) if with_sidecar else None
+        if sidecar is None:
+            writes.append((writer.submit(fn, *args), [output_path], []))
+            return
+        _, sidecar_data = build_xmp_sidecar(output_path, taken_at, location, caption)
+        writes.append((writer.submit(write_with_sidecar, fn, args, output_path, sidecar, sidecar_data), [output_path, sidecar], []))
+        sidecar_paths.append(sidecar)
+
+    # Function to queue an output file for the writer
+    def write(output_path, output_data, with_sidecar=False):
+        submit(write_file_atomic, (output_path, output_data), output_path, with_sidecar)
+
+    # Function to queue a converted image, with its sidecar
+    def write_converted(output_path, output_data):
+        write(output_path, output_data, with_sidecar=True)
+
+    # Function to make and queue the previews of an output image from its decoded pixels
+    def write_previews(role, output_path, img):
+        renditions = make_renditions(img, options.previews)
+        for size, _, rendition_data in renditions:
+            write(rendition_path(task['previews_folder'], output_path, size), rendition_data)
+        previews[role] = describe_renditions(task['previews_folder'], output_path, renditions)
+
+    for path, role, new_path in task['images']:
+        try:
+            logger.info(f"Found image: {path}")
+            # Decode the source once, the pixels are reused for the combined image.
+            # A secondary image that is only needed for the inset is decoded at
+            # the inset size right away. Previews are made from the full image.
+            # Sources that were not read ahead are read once here, the bytes
+            # are hashed for the manifest as well.
+            data = source_data.get(role)
+            if data is None and needs_source_data(task, options):
+                try:
+                    data = source_data[role] = read_source(path)
+                except Exception:
+                    pass  # Reported by the steps below, which read the source again
+            needs_full_image = (encoder is not None and not encoder.keep_source and path.suffix.lower() == '.webp') or bool(options.previews)
+            if needs_full_image or combined_image_path is not None:
+                try:
+                    if needs_full_image or role == 'primary':
+                        decoded_images[role] = load_image(path, data)
+                    else:
+                        decoded_images[role] = compositor.load_secondary(path, data)
+                        secondary_is_inset = True
+                except Exception as e:
+                    logger.error(f"Error decoding {path}: {e}")
+
+            # Check if conversion to JPEG is enabled by the user
+            converted = False
+            if options.convert_to_jpeg:
+                # Convert WebP to JPEG if necessary, EXIF and IPTC data are added on the way
+                converted_path, converted = convert_webp_to_jpg(path, new_path, taken_at, location, caption, img=decoded_images.get(role), encoder=encoder, data=data, write=write_converted)
+                if converted_path is None:
+                    counts['skipped'] += 1
+                    complete = False
+                    continue  # Skip this file if conversion failed
+                if converted:
+                    counts['converted'] += 1
+                    logger.info(f"EXIF data added to converted image.")
+
+            if not converted:
+                if new_path.suffix.lower() == '.webp' and options.webp_metadata == 'embed':
+                    # Add the metadata to a copy of the WebP file, the image data stays as it is
+                    write(new_path, tag_webp(data or read_source(path), taken_at, location, caption))
+                    logger.info(f"Metadata added to WebP image.")
+                else:
+                    submit(copy_source, (path, new_path, options.link), new_path, with_sidecar=True) # Copy or link to new path
+
+            output_paths[role] = new_path
+            logger.info(f"Sucessfully processed {role} image.")
+            counts['processed'] += 1
+            writes[-1][2].extend(['processed', 'converted'] if converted else ['processed'])
+            if options.previews:
+                if role not in decoded_images:
+                    raise ValueError("No decoded image to make previews of")
+                write_previews(role, new_path, decoded_images[role])
+        except Exception as e:
+            logger.error(f"Error processing {role} image {path}: {e}")
+            complete = False
+
+    # Create combined image if user chose 'yes' and both images are available
+    # The composite is built from the decoded originals and encoded once, in
+    # the same format as the singular images.
+    outputs = [str(path) for path in list(output_paths.values()) + sidecar_paths]
+    if combined_image_path is not None and 'primary' in decoded_images and 'secondary' in decoded_images:
+        try:
+            with metrics.stage('combine'):
+                if secondary_is_inset:
+                    combined_image = compositor.combine_inset(decoded_images['primary'], decoded_images['secondary'])
+                else:
+                    combined_image = combine_images_with_resizing(decoded_images['primary'], decoded_images['secondary'])
+            if encoder is not None:
+                combined_data = encoder.encode(combined_image, taken_at, location, caption)
+            else:
+                combined_data = encode_webp(combined_image, taken_at, location, caption, xmp=options.webp_metadata == 'embed')
+            write(combined_image_path, combined_data, with_sidecar=True)
+            writes[-1][2].append('combined')
+            outputs.append(str(combined_image_path))
+            if sidecar_path(combined_image_path, options) is not None:
+                outputs.append(str(sidecar_paths[-1]))
+            if options.previews:
+                write_previews('combined', combined_image_path, combined_image)
+            counts['combined'] += 1
+
+            logger.info(f"Combined image saved: {combined_image_path}")
+            logger.info(f"Metadata added to combined image.")
+        except Exception as e:
+            logger.error(f"Error creating combined image {combined_image_path}: {e}")
+            complete = False
+    elif combined_image_path is not None:
+        complete = False
+
+    for image in previews.values():
+        outputs.extend(rendition['path'] for rendition in image['renditions'].values())
+
+    # Hash the images that were read anyway, for the manifest
+    hashes = {}
+    if complete and 'fingerprints' not in task:
+        for role, data in source_data.items():
+            hashes[role] = source_hash(task['sources'][role], data)
+    return {'counts': counts, 'complete': complete, 'outputs': outputs, 'writes': writes, 'previews': previews, 'hashes': hashes}
+
+# Function to add or remove the previews of an entry whose outputs did not change
+# Renditions of new sizes are made from the sources, and for the combined
+# image from the output, since it was not decoded. Renditions of sizes that
+# are not made anymore are left out of the outputs, so they are removed once
+# the entry is recorded.
+def _process_previews(task, options, writer):
+    previous = task['previous']
+    source_data = task.get('data') or {}
+    recorded = (previous.get('previews') or {}).get('images', {})
+    sizes = {str(size) for size in options.previews}
+    removed = {rendition['path'] for image in recorded.values() for size, rendition in image['renditions'].items() if size not in sizes}
+    outputs = [output for output in previous['outputs'] if output not in removed]
+    writes = []
+    previews = {}
+    complete = True
+
+    images = [(path, role, new_path) for path, role, new_path in task['images']]
+    if task['combined_path'] is not None:
+        images.append((task['combined_path'], 'combined', task['combined_path']))
+    for path, role, output_path in images if options.previews else []:
+        try:
+            kept = {size: rendition for size, rendition in recorded.get(role, {}).get('renditions', {}).items() if size in sizes}
+            missing = [size for size in options.previews if str(size) not in kept]
+            renditions = make_renditions(load_image(path, source_data.get(role)), missing) if missing else []
+            for size, _, rendition_data in renditions:
+                new_rendition = rendition_path(task['previews_folder'], output_path, size)
+                writes.append((writer.submit(write_file_atomic, new_rendition, rendition_data), [new_rendition], []))
+                outputs.append(str(new_rendition))
+            previews[role] = describe_renditions(task['previews_folder'], output_path, renditions)
+            previews[role]['renditions'].update(kept)
+        except Exception as e:
+            logger.error(f"Error making previews of {role} image {path}: {e}")
+            complete = False
+    return {'counts': {}, 'complete': complete, 'outputs': outputs, 'writes': writes, 'previews': previews, 'hashes': {}}
+
+# Function to wait for the queued writes of an entry and build its manifest record
+def _finish_entry(task, options, state):
+    counts = state['counts']
+    complete = state['complete']
+    outputs = state['outputs']
+    for future, paths, counters in state['writes']:
+        try:
+            metrics.current().merge(future.result())
+        except Exception as e:
+            logger.error(f"Error writing {paths[0]}: {e}")
+            complete = False
+            for path in paths:
+                if str(path) in outputs:
+                    outputs.remove(str(path))
+            for name in counters:
+                counts[name] -= 1
+            if 'converted' in counters:
+                counts['skipped'] += 1
+
+    # Remove the placeholders of outputs that could not be written
+    if not complete:
+        for path in planned_outputs(task, options):
+            if path not in outputs:
+                release_placeholder(path)
+
+    record = None
+    if complete:
+        try:
+            fingerprints = task.get('fingerprints') or {role: source_fingerprint(path, state['hashes'].get(role)) for role, path in task['sources'].items()}
+            record = {
+                'key': task['key'],
+                'sources': fingerprints,
+                'settings': options.output_settings(),
+                'content': content_key(fingerprints, task, options.output_settings()),
+                'outputs': outputs,
+            }
+            if options.previews:
+                record['previews'] = {
+                    'taken_at': task['taken_at'].isoformat(),
+                    'location': task['location'],
+                    'caption': task['caption'],
+                    'images': state['previews'],
+                }
+        except OSError as e:
+            logger.error(f"Failed to record entry {task['key']} in manifest: {e}")
+
+    return {'counts': counts, 'record': record}
+
+# Function to plan the entries of posts.json one by one, in input order
+# Entries whose sources, settings and outputs did not change since the last
+# run are skipped and counted in stats.unchanged. If only the preview sizes
+# changed, they keep their outputs and only get their previews updated, see
+# _process_previews. Changed entries may
+# overwrite their previous outputs. Entries that were interrupted are always
+# processed again, and get back the names in `pending` (see load_manifest).
+# Other entries are looked up by the sizes of their images in `content_index`
+# (see build_content_index), before anything is decoded. Only if that finds
+# candidates are the images hashed here, to compare the content keys. If the
+# same post was already processed, e.g. from another export or the
+# Photos/bereal folder, the entry is planned as a duplicate of it and gets no
+# outputs of its own. New entries are hashed later, from the bytes read for
+# processing them.
+def plan_tasks(posts, options, folders, manifest, registry, stats, content_index=None, pending=None):
+    settings = options.output_settings()
+    content_index = {} if content_index is None else content_index
+    pending = {} if pending is None else pending
+    planned = {}  # Entries planned in this run, by key
+    for index, task, error in posts:
+        if task is None:
+            logger.error(f"Error processing entry {index} of posts.json: {error}")
+            stats.metrics.add_entry(index, None, 'error')
+            continue
+        try:
+            if task['key'] in planned:
+                # The same post is listed twice in posts.json, it is processed once
+                stats.duplicates += 1
+                stats.metrics.add_entry(index, task['key'], 'duplicate')
+                logger.info(f"Skipped {task['key']}, it is listed twice in posts.json.")
+                continue
+            previous = manifest.get(task['key'])
+            interrupted = task['key'] in pending
+            if not options.force and not interrupted and entry_is_unchanged(previous, task['sources'], settings, manifest):
+                if 'duplicate_of' in previous or recorded_sizes(previous) == sorted(set(options.previews)):
+                    stats.unchanged += 1
+                    stats.metrics.add_entry(index, task['key'], 'unchanged')
+                    continue
+                planned[task['key']] = task
+                plan_entry(task, options, folders, registry, {Path(output) for output in previous['outputs']})
+                if all(output in previous['outputs'] for output in planned_outputs(task, options)):
+                    task['previews_only'] = True
+                    task['previous'] = previous
+                    task['fingerprints'] = previous['sources']
+                yield task
+                continue
+            sizes = None
+            if not options.force and not interrupted:
+                try:
+                    sizes = size_key({role: source_stat(path)[0] for role, path in task['sources'].items()})
+                except OSError:
+                    pass  # A missing image is reported when the entry is processed, the other one is still processed
+            if sizes is not None:
+                original_key = find_original(task, content_index.get(sizes, ()), manifest, planned, settings)
+                original = manifest.get(original_key)
+                if original_key == task['key'] and original_key not in planned and original is not None and all(os.path.exists(output) for output in original['outputs']):
+                    # Same post from a different copy of the export, only the sources moved
+                    original['sources'] = task['fingerprints']
+                    add_duplicate(stats, task, original)
+                    continue
+                if original_key is not None and original_key != task['key'] and (original_key in planned or all(os.path.exists(output) for output in original['outputs'])):
+                    # Duplicate of an entry processed earlier, or of one still being processed in this run
+                    task['duplicate_of'] = original_key
+                    yield task
+                    continue
+                content_index.setdefault(sizes, []).append(task['key'])
+            planned[task['key']] = task
+            reusable = {Path(output) for output in (previous['outputs'] if previous else []) + pending.get(task['key'], [])}
+            yield plan_entry(task, options, folders, registry, reusable)
+        except Exception as e:
+            logger.error(f"Error processing entry {index} of posts.json: {e!r}")
+            stats.metrics.add_entry(index, task['key'], 'error')
+
+# Function to set the fingerprints and content key of a task, hashing its images
+def _hash_task(task, settings):
+    if 'content' not in task:
+        task['fingerprints'] = {role: source_fingerprint(path) for role, path in task['sources'].items()}
+        task['content'] = content_key(task['fingerprints'], task, settings)
+    return task['content']
+
+# Function to find the entry among `candidates` with the same content as the task, returns its key or None
+# Candidates planned in this run are hashed too, their records are not written yet.
+def find_original(task, candidates, manifest, planned, settings):
+    for candidate in candidates:
+        if candidate in planned:
+            content = _hash_task(planned[candidate], settings)
+        elif candidate in manifest:
+            content = manifest[candidate].get('content')
+        else:
+            continue
+        if _hash_task(task, settings) == content:
+            return candidate
+    return None
+
+# Function to count an entry that was skipped as a duplicate of `original`
+def add_duplicate(stats, task, original):
+    stats.duplicates += 1
+    stats.duplicate_bytes += sum(fingerprint['size'] for fingerprint in task['fingerprints'].values())
+    stats.saved_seconds += original.get('seconds', 0.0)
+    stats.metrics.add_entry(task['index'], task['key'], 'duplicate')
+    logger.info(f"Skipped {task['key']}, it has the same images and metadata as {original['key']}.")
+
+# Writer for the outputs of this process, see _init_worker
+_worker_writer = OutputWriter(0)
+
+# Function to set up logging and the output writer in worker processes
+# Started with fork the workers inherit the logging setup, otherwise they log
+# with the given level and the default format.
+def _init_worker(log_level, write_queue_size):
+    global _worker_writer
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level)
+    _worker_writer = OutputWriter(write_queue_size)
+
+# Function to check whether the sources of a task are read by processing, or only copied
+def needs_source_data(task, options):
+    if 'duplicate_of' in task:
+        return False
+    if task.get('previews_only'):
+        return bool(options.previews)
+    return options.convert_to_jpeg or options.create_combined_images or options.webp_metadata == 'embed'
+
+# Function to process planned entries, in parallel if more than one job is used
+# Results are yielded in input order. Only a few entries per worker are
+# submitted ahead, so the number of entries held in memory stays bounded.
+# In a single process, reading, processing and writing overlap (see
+# pipeline.py): the sources of the next entries are read ahead, and an entry
+# is only finished once the next one was processed, so its outputs were
+# written in the meantime. Workers write their outputs in the background too.
+def run_tasks(tasks, options):
+    if options.jobs <= 1:
+        with OutputWriter(options.prefetch) as writer:
+            started = None
+            for task in prefetch_tasks(tasks, options.prefetch, lambda task: needs_source_data(task, options)):
+                entry = start_entry(task, options, writer)
+                if started is not None:
+                    yield started['task'], finish_entry(started)
+                started = entry
+            if started is not None:
+                yield started['task'], finish_entry(started)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=options.jobs, initializer=_init_worker, initargs=(logging.getLogger().level, options.prefetch))
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append((task, executor.submit(process_entry, task, options)))
+            if len(pending) >= 2 * options.jobs:
+                task, future = pending.popleft()
+                yield task, future.result()
+        while pending:
+            task, future = pending.popleft()
+            yield task, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def process_export(export_dir, output_dir=None, options=None, progress=None, report_path=None):
+    """Process one BeReal export and return a Stats object.
+
+    `export_dir` is the unzipped folder with posts.json and the Photos folder,
+    or the export ZIP itself, which is read without extracting it. See
+    ExportFolders for where outputs go without `output_dir`.
+    `progress` is called as progress(done, total) after every entry, where
+    total is the number of selected entries, or estimated from the number of
+    images in the export without the posts index.
+    A JSON report of the run is written to `report_path`, by default
+    run-report.json in the output folder.
+    Raises FileNotFoundError if the export has no posts.json and ValueError
+    if the encoder preset can not be used.
+    """
+    started = datetime.now()
+    start = time.perf_counter()
+    options = options or Options()
+    if options.convert_to_jpeg:
+        options.get_encoder()
+    export = open_export(export_dir)
+    folders = ExportFolders.from_dirs(export_dir, output_dir)
+    if not export.has_posts():
+        raise FileNotFoundError(f"JSON file not found in {export}")
+
+    folders.output_folder.mkdir(parents=True, exist_ok=True)  # Create the output folder if it doesn't exist
+    if options.create_combined_images:
+        folders.output_folder_combined.mkdir(parents=True, exist_ok=True)
+    for size in options.previews:
+        (folders.previews_folder / str(size)).mkdir(parents=True, exist_ok=True)
+
+    # Posts of the export, from the index in the output folder if it is current
+    stats = Stats()
+    filters = (options.since, options.until, options.only_with_location)
+    posts_index = None
+    if options.use_index:
+        with metrics.collect(stats.metrics):
+            posts_index = open_posts_index(export, folders.output_folder)
+    if posts_index is not None:
+        stats.input_files = sum(posts_index.count_images(export).values())
+        total_entries = posts_index.count(export, *filters)
+    else:
+        stats.input_files = sum(export.count_images().values())
+        total_entries = stats.input_files // 2
+
+    # Entries processed by earlier runs
+    manifest_path = folders.output_folder / 'manifest.jsonl'
+    pending = {}
+    manifest = load_manifest(manifest_path, pending)
+    content_index = build_content_index(manifest)
+
+    if options.jobs > 1:
+        logger.info(f"Processing entries with {options.jobs} worker processes.")
+
+    # Process files
+    # Entries flow through planning, processing and recording one at a time.
+    # Finished entries are appended to the manifest right away, so an
+    # interrupted run resumes where it stopped.
+    # The outputs of interrupted entries are only reused and cleaned up while
+    # no other run writes to the output folder, it may be writing them.
+    registry = NameRegistry(folders.output_folder, folders.output_folder_combined)
+    with FolderLock(folders.output_folder) as lock, open(manifest_path, 'a', encoding="utf8") as manifest_file, metrics.collect(stats.metrics):
+        interrupted = pending if lock.acquired else {}
+        if pending and not lock.acquired:
+            logger.warning(f"Another run is writing to {folders.output_folder}, the outputs of interrupted entries are left as they are.")
+
+        # Function to record the names of the planned outputs before they are written
+        def mark_pending(tasks):
+            for task in tasks:
+                if 'duplicate_of' not in task and not task.get('previews_only'):
+                    planned = planned_outputs(task, options)
+                    pending[task['key']] = sorted(set(pending.get(task['key'], [])) | set(planned))
+                    manifest_file.write(json.dumps({'key': task['key'], 'pending': pending[task['key']]}) + '\n')
+                    manifest_file.flush()
+                yield task
+
+        tasks = plan_tasks(select_posts(export, posts_index, *filters), options, folders, manifest, registry, stats, content_index, interrupted)
+        results = run_tasks(mark_pending(tasks), options)
+        try:
+            for task, result in results:
+                for name, count in result['counts'].items():
+                    setattr(stats, name, getattr(stats, name) + count)
+                stats.metrics.merge(result['metrics'])
+
+                record = result['record']
+                if record is not None and 'duplicate_of' in record:
+                    # Results come in input order, so the entry it duplicates is recorded by now
+                    original = manifest.get(record['duplicate_of'])
+                    if original is not None and original.get('content') == record['content']:
+                        add_duplicate(stats, task, original)
+                    else:
+                        logger.error(f"Entry {record['key']} duplicates {record['duplicate_of']}, which failed. It will be processed on the next run.")
+                        stats.metrics.add_entry(task['index'], task['key'], 'failed')
+                        record = None
+
+                if progress is not None:
+                    done = len(stats.metrics.entries)
+                    progress(done, max(done, total_entries))
+
+                if record is not None:
+                    if task.get('previews_only'):
+                        stats.previews_updated += 1
+                    previous = manifest.get(record['key'])
+                    manifest_file.write(json.dumps(record) + '\n')
+                    manifest_file.flush()
+                    manifest[record['key']] = record
+                    registry.claimed.difference_update(Path(output) for output in record['outputs'])
+
+                    # Remove outputs of an earlier run that were not replaced, also of an interrupted one
+                    # Without the lock, those of an interrupted run stay pending for the next run.
+                    replaced = set(previous['outputs']) if previous else set()
+                    leftovers = set(pending.pop(record['key'], [])) - set(record['outputs'])
+                    if lock.acquired:
+                        replaced.update(leftovers)
+                    elif leftovers:
+                        pending[record['key']] = sorted(leftovers)
+                    for output in replaced - set(record['outputs']):
+                        if Path(output) not in registry.allocated and os.path.exists(output):
+                            os.remove(output)
+        except ValueError as e:
+            logger.error(f"Stopped reading posts.json: {e}")
+        finally:
+            # Wait for the outputs that are still being written, also when the run is interrupted
+            results.close()
+            if posts_index is not None:
+                posts_index.close()
+            registry.release_unrecorded()
+
+    if progress is not None:
+        done = len(stats.metrics.entries)
+        progress(done, done)
+
+    if stats.unchanged:
+        logger.info(f"Skipped {stats.unchanged} entries that did not change since the last run.")
+    if stats.duplicates:
+        logger.info(f"Skipped {stats.duplicates} duplicate entries ({stats.duplicate_bytes / 1e6:.1f} MB of images, {stats.saved_seconds:.1f} s of processing).")
+
+    if stats.previews_updated:
+        logger.info(f"Updated the previews of {stats.previews_updated} unchanged entries.")
+
+    save_manifest(manifest_path, manifest, pending)
+    # The catalog is also updated without previews, so it does not list previews that were removed
+    # Once no post has previews anymore, it is removed with the empty folders.
+    catalog_path = folders.previews_folder / CATALOG_NAME
+    if options.previews or catalog_path.exists():
+        posts = write_catalog(catalog_path, manifest)
+        logger.info(f"Catalog of {posts} posts written to {catalog_path}.")
+        if not posts and not options.previews:
+            catalog_path.unlink()
+    remove_unused_folders(folders.previews_folder, options.previews)
+
+    stats.seconds = time.perf_counter() - start
+    report = {
+        'export': str(export),
+        'output_folder': str(folders.output_folder),
+        'started': started.isoformat(timespec='seconds'),
+        'options': asdict(options),
+        'stats': stats.as_dict(),
+        'images_per_sec': stats.processed / stats.seconds if stats.seconds else 0.0,
+        'bytes_read': stats.metrics.bytes_read,
+        'bytes_written': stats.metrics.bytes_written,
+        'outcomes': stats.metrics.outcomes(),
+        'stages': stats.metrics.stage_summary(),
+        'queues': stats.metrics.queue_summary(),
+        'entries': stats.metrics.entries,
+    }
+    report_path = Path(report_path) if report_path else folders.output_folder / 'run-report.json'
+    write_file_atomic(report_path, json.dumps(report, indent=2, default=str).encode('utf8'))
+    return stats
@@ -0,0 +1,168 @@
+import os
+from pathlib import Path
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+    import msvcrt
+
+# Function to write a file in one go
+# Data goes to a temporary file next to the target first, so an interrupted
+# run never leaves a half-written image behind.
+def write_file_atomic(path, data):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with metrics.stage('write'):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        metrics.add_bytes_written(len(data))
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+# Registry of output filenames, to handle deduplication
+# The output folders are scanned once, after that names are handed out from
+# memory. For every base name the next free `_N` suffix is remembered, so
+# many posts taken in the same second do not probe the same names again.
+# Names are only handed out by the main process, in input order, so parallel
+# workers never race for them. Each new name is claimed on disk with an
+# exclusive create, which leaves an empty placeholder until the worker writes
+# the file. Another run writing to the same folder therefore can not pick the
+# same name. At the end of the run, release_unrecorded() removes the
+# placeholders of entries that did not make it into the manifest and were
+# never written, e.g. because the run was interrupted.
+class NameRegistry:
+    def __init__(self, *folders):
+        self._taken = {}
+        self._next_counter = {}
+        self.allocated = set()
+        self.claimed = set()  # Claimed paths of entries that are not in the manifest yet
+        for folder in folders:
+            self._taken[folder] = self._scan(folder)
+
+    @staticmethod
+    def _scan(folder):
+        try:
+            with os.scandir(folder) as entries:
+                return {entry.name for entry in entries}
+        except FileNotFoundError:
+            return set()
+
+    # Function to create an empty file, fails if it already exists
+    @staticmethod
+    def _claim(path):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    # Function to check whether `candidate` is `path` or one of its `_N` variants
+    @staticmethod
+    def _is_variant(candidate, path):
+        if candidate.parent != path.parent or candidate.suffix != path.suffix:
+            return False
+        counter = candidate.stem[len(path.stem) + 1:] if candidate.stem.startswith(f"{path.stem}_") else None
+        return candidate.stem == path.stem or (counter is not None and counter.isdigit())
+
+    # Function to claim the files that go with a candidate, e.g. its XMP sidecar
+    # Returns False if one of them is taken. Those listed in `reusable` are
+    # handed out again like the candidate.
+    def _claim_companions(self, candidate, companions, reusable, taken):
+        paths = [candidate.with_suffix(suffix) for suffix in companions]
+        new_claims = []
+        for companion in paths:
+            if companion in reusable and companion not in self.allocated:
+                continue
+            if companion.name in taken or not self._claim(companion):
+                taken.add(companion.name)
+                for claimed in new_claims:
+                    os.remove(claimed)
+                return False
+            new_claims.append(companion)
+        for companion in paths:
+            taken.add(companion.name)
+            self.allocated.add(companion)
+            self.claimed.add(companion)
+        return True
+
+    # Function to get a unique path for `path`
+    # Existing files listed in `reusable` (previous outputs of the same entry)
+    # are handed out again and may be overwritten, also when they got an `_N`
+    # suffix, so an entry keeps its names when it is processed again.
+    # `companions` are suffixes of files that are written next to the output
+    # under the same name, e.g. ('.xmp',) for a sidecar. They are claimed with
+    # it, and a name is only handed out if they are free too.
+    def allocate(self, path, reusable=(), companions=()):
+        taken = self._taken.setdefault(path.parent, set())
+        for candidate in sorted(reusable):
+            if candidate not in self.allocated and self._is_variant(candidate, path) and self._claim_companions(candidate, companions, reusable, taken):
+                taken.add(candidate.name)
+                self.allocated.add(candidate)
+                self.claimed.add(candidate)
+                return candidate
+
+        key = (path.parent, path.stem, path.suffix)
+        counter = self._next_counter.get(key, 0)
+        candidate = path
+        while True:
+            if counter:
+                candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+            counter += 1
+            if candidate.name in taken:
+                continue
+            taken.add(candidate.name)
+            if self._claim(candidate):
+                if self._claim_companions(candidate, companions, reusable, taken):
+                    break
+                os.remove(candidate)
+        self._next_counter[key] = counter
+        self.allocated.add(candidate)
+        self.claimed.add(candidate)
+        return candidate
+
+    # Function to remove the placeholders of entries that were not recorded
+    # Outputs that were written are kept, they are counted as processed.
+    def release_unrecorded(self):
+        for path in self.claimed:
+            release_placeholder(path)
+        self.claimed.clear()
+
+# Lock on an output folder, held while a run writes to it
+# Only one run at a time acquires it, `acquired` is False for the others.
+# The lock is released when it is closed, or when the process ends, also if
+# it is killed.
+class FolderLock:
+    def __init__(self, folder):
+        self._file = open(Path(folder) / '.lock', 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            self.acquired = True
+        except OSError:
+            self.acquired = False
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Function to remove placeholders of outputs that were never written
+def release_placeholder(path):
+    try:
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,343 @@
+import io
+import logging
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+from . import metrics
+from .files import write_file_atomic
+from .metadata import build_exif, build_iptc_segment, build_xmp, insert_webp_metadata, _insert_jpeg_segment
+from .sources import read_source
+
+logger = logging.getLogger(__name__)
+
+# Function to import NumPy once it is needed, returns None if it is not installed
+# NumPy is optional and only used by BatchCompositor, which falls back to
+# Pillow without it. Importing it takes longer than the rest of the package.
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+# Function to decode an image of an export into memory
+# The file is read in one go first, so reading and decoding are timed apart.
+# Bytes that were already read ahead can be passed in as `data`.
+def load_image(image_path, data=None):
+    if data is None:
+        data = read_source(image_path)
+    with metrics.stage('decode'), Image.open(io.BytesIO(data)) as img:
+        img.load()
+        return img if img.mode == 'RGB' else img.convert('RGB')
+
+# Function to convert WEBP to JPEG
+# The JPEG is encoded in memory together with its metadata and written once,
+# directly to its final name. An image that was already decoded can be passed
+# in as `img`, its bytes as `data`. With an `encoder` (see encoders.py) the
+# image is converted to its format instead, or kept as WebP with metadata
+# added. `write` is called with the path and the encoded data, e.g. to queue
+# the file for a writer thread.
+def convert_webp_to_jpg(image_path, jpg_path, datetime_original, location=None, caption=None, img=None, encoder=None, data=None, write=write_file_atomic):
+    if image_path.suffix.lower() == '.webp':
+        output_format = encoder.format if encoder is not None else 'JPEG'
+        try:
+            if encoder is not None and encoder.keep_source:
+                output_data = tag_webp(data or read_source(image_path), datetime_original, location, caption)
+            else:
+                if img is None:
+                    img = load_image(image_path, data)
+                if encoder is not None:
+                    output_data = encoder.encode(img, datetime_original, location, caption)
+                else:
+                    output_data = encode_jpeg(img, datetime_original, location, caption, quality=80)
+            write(jpg_path, output_data)
+            logger.info(f"Converted {image_path} to {output_format}.")
+            return jpg_path, True
+        except Exception as e:
+            logger.error(f"Error converting {image_path} to {output_format}: {e}")
+            return None, False
+    else:
+        return image_path, False
+
+# Function to encode an image as JPEG with EXIF and IPTC data embedded
+# Further Pillow options like optimize or progressive can be passed on.
+def encode_jpeg(img, datetime_original, location=None, caption=None, quality=80, **options):
+    save_options = {'quality': quality, **options}
+    with metrics.stage('exif'):
+        exif_bytes = build_exif(datetime_original, location, caption)
+    if exif_bytes is not None:
+        save_options['exif'] = exif_bytes
+
+    buffer = io.BytesIO()
+    with metrics.stage('encode'):
+        img.save(buffer, "JPEG", **save_options)
+    jpeg_data = buffer.getvalue()
+
+    with metrics.stage('iptc'):
+        iptc_segment = build_iptc_segment(caption)
+    if iptc_segment is not None:
+        jpeg_data = _insert_jpeg_segment(jpeg_data, iptc_segment)
+        logger.info(f"Updated IPTC Caption-Abstract.")
+    return jpeg_data
+
+# Function to encode an image as WebP with EXIF data embedded
+# WebP has no place for IPTC data, so only EXIF is added, and XMP data if
+# `xmp` is set.
+def encode_webp(img, datetime_original, location=None, caption=None, quality=80, xmp=False, **options):
+    save_options = {'quality': quality, **options}
+    with metrics.stage('exif'):
+        exif_bytes = build_exif(datetime_original, location, caption)
+    if exif_bytes is not None:
+        save_options['exif'] = exif_bytes
+    if xmp:
+        with metrics.stage('xmp'):
+            xmp_bytes = build_xmp(datetime_original, location, caption)
+        if xmp_bytes is not None:
+            save_options['xmp'] = xmp_bytes
+
+    buffer = io.BytesIO()
+    with metrics.stage('encode'):
+        img.save(buffer, "WEBP", **save_options)
+    return buffer.getvalue()
+
+# Function to encode an image as AVIF with EXIF and XMP data embedded
+# Needs a Pillow build with AVIF support.
+def encode_avif(img, datetime_original, location=None, caption=None, quality=60, **options):
+    save_options = {'quality': quality, **options}
+    with metrics.stage('exif'):
+        exif_bytes = build_exif(datetime_original, location, caption)
+    if exif_bytes is not None:
+        save_options['exif'] = exif_bytes
+    with metrics.stage('xmp'):
+        xmp_bytes = build_xmp(datetime_original, location, caption)
+    if xmp_bytes is not None:
+        save_options['xmp'] = xmp_bytes
+
+    buffer = io.BytesIO()
+    with metrics.stage('encode'):
+        img.save(buffer, "AVIF", **save_options)
+    return buffer.getvalue()
+
+# Function to add EXIF and XMP data to a WebP file without re-encoding it
+def tag_webp(webp_data, datetime_original, location=None, caption=None):
+    with metrics.stage('exif'):
+        exif_bytes = build_exif(datetime_original, location, caption)
+    with metrics.stage('xmp'):
+        xmp_bytes = build_xmp(datetime_original, location, caption)
+    return insert_webp_metadata(webp_data, exif_bytes, xmp_bytes)
+
+# Function to build the XMP sidecar file of an image, returns its path and data
+# The sidecar is named like the image with the suffix .xmp, as expected by
+# Lightroom, digiKam and most other photo managers.
+def build_xmp_sidecar(image_path, datetime_original, location=None, caption=None):
+    with metrics.stage('xmp'):
+        xmp_bytes = build_xmp(datetime_original, location, caption)
+    if xmp_bytes is None:
+        raise ValueError(f"No XMP data for {image_path}")
+    return image_path.with_suffix('.xmp'), xmp_bytes
+
+# Compositor for combined images like the original BeReal memories
+# The rounded-corner mask and the outline sprite only depend on the size of the
+# resized secondary image, so they are drawn once and kept in a small LRU cache
+# that is shared by every post of a run.
+class ImageCompositor:
+    def __init__(self, corner_radius=60, outline_size=7, position=(55, 55), scaling_factor=1/3.33333333, reducing_gap=1.5, cache_size=8):
+        self.corner_radius = corner_radius  # radius for the rounded corners
+        self.outline_size = outline_size  # thickness of the black outline
+        self.position = position  # margin to the borders
+        self.scaling_factor = scaling_factor  # size of the secondary image relative to its original size
+        self.reducing_gap = reducing_gap  # shrink by an integer factor first if the image is this many times larger than the inset, None to disable
+        self.cache_size = cache_size
+        self._assets = OrderedDict()
+
+    # Function to compute the size of the inset for a secondary image of the given size
+    def inset_size(self, size):
+        width, height = size
+        return (int(width * self.scaling_factor), int(height * self.scaling_factor))
+
+    # Function to get the mask and outline sprite for a resized secondary image
+    def _get_assets(self, size):
+        key = (size, self.corner_radius, self.outline_size)
+        if key in self._assets:
+            self._assets.move_to_end(key)
+            return self._assets[key]
+
+        width, height = size
+
+        # Create mask for rounded corners
+        mask = Image.new('L', size, 0)
+        draw = ImageDraw.Draw(mask)
+        draw.rounded_rectangle((0, 0, width, height), self.corner_radius, fill=255)
+
+        # Create mask for the black outline, only as large as the inset plus its outline
+        outline_mask = Image.new('L', (width + 2 * self.outline_size + 1, height + 2 * self.outline_size + 1), 0)
+        draw = ImageDraw.Draw(outline_mask)
+        draw.rounded_rectangle((0, 0, width + 2 * self.outline_size, height + 2 * self.outline_size), self.corner_radius + self.outline_size, fill=255)
+
+        self._assets[key] = (mask, outline_mask)
+        if len(self._assets) > self.cache_size:
+            self._assets.popitem(last=False)
+        return mask, outline_mask
+
+    # Function to resize a secondary image to the inset size
+    # The size is computed from `original_size` if the image was decoded at a
+    # reduced scale. With `reducing_gap` set, Pillow first shrinks the image
+    # by an integer factor, which is much cheaper than running LANCZOS over all
+    # pixels and looks the same at this size.
+    def resize_secondary(self, secondary_image, original_size=None):
+        new_size = self.inset_size(original_size or secondary_image.size)
+        if secondary_image.size != new_size:
+            # Resize the secondary image using LANCZOS resampling for better quality
+            secondary_image = secondary_image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=self.reducing_gap)
+        if secondary_image.mode != 'RGB':
+            secondary_image = secondary_image.convert('RGB')
+        return secondary_image
+
+    # Function to decode a secondary image directly at the inset size
+    # JPEG files are decoded at a reduced scale (1/2, 1/4 or 1/8) that is still
+    # larger than the inset. WebP has no reduced decoding in Pillow, so those
+    # are decoded in full and shrunk by resize_secondary.
+    def load_secondary(self, image_path, data=None):
+        if data is None:
+            data = read_source(image_path)
+        with metrics.stage('decode'), Image.open(io.BytesIO(data)) as img:
+            original_size = img.size
+            if img.format == 'JPEG':
+                img.draft('RGB', self.inset_size(original_size))
+            img.load()
+            return self.resize_secondary(img, original_size)
+
+    # Function to combine the decoded primary and secondary image of a post
+    def combine(self, primary_image, secondary_image):
+        return self.combine_inset(primary_image, self.resize_secondary(secondary_image))
+
+    # Function to combine a primary image with a secondary image that already has the inset size
+    def combine_inset(self, primary_image, resized_secondary_image):
+        mask, outline_mask = self._get_assets(resized_secondary_image.size)
+
+        # Start from a copy of the primary image
+        combined_image = primary_image.convert('RGB') if primary_image.mode != 'RGB' else primary_image.copy()
+
+        # Draw the black outline with rounded corners, only within its bounding box
+        x, y = self.position
+        outline_origin = (x - self.outline_size, y - self.outline_size)
+        combined_image.paste((0, 0, 0), outline_origin + (outline_origin[0] + outline_mask.width, outline_origin[1] + outline_mask.height), outline_mask)
+
+        # Paste the secondary image onto the combined image using the rounded corners mask
+        combined_image.paste(resized_secondary_image, self.position, mask)
+
+        return combined_image
+
+# Compositor for many combined images at once, e.g. to render them again after a style change
+# Combining only changes the box around the inset, so only that box is taken
+# from the primary images. The outline and the rounded mask are folded into
+# two weights per pixel of the box, which are cached like the masks:
+#
+#   box = primary_box * (1 - outline) * (1 - mask) + secondary * mask
+#
+# Within the inset the secondary image is copied as it is. Only the pixels
+# along the rounded corners and the outline, about a tenth of the box, are
+# blended, for a whole group of pairs with the same sizes in one NumPy
+# operation. The boxes are pasted back into the primary images, which are
+# modified in place, so no full-size copy is made. The result is the same as
+# with combine_inset. Without NumPy, or if the box does not fit into the
+# image, every pair is combined with combine_inset.
+class BatchCompositor(ImageCompositor):
+    def __init__(self, *args, batch_size=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size  # pairs blended at once, each holds a decoded primary image in memory
+        self._weights = OrderedDict()
+
+    # Function to get the pixels of the box around an inset that need blending, with their weights
+    # Returns the flat indices of the pixels and the weights of the primary
+    # and the secondary image for them.
+    def _get_weights(self, size):
+        key = (size, self.corner_radius, self.outline_size)
+        if key in self._weights:
+            self._weights.move_to_end(key)
+            return self._weights[key]
+
+        np = _import_numpy()
+        mask, outline_mask = self._get_assets(size)
+        outline = np.asarray(outline_mask, dtype=np.float32) / 255
+        inset = np.zeros_like(outline)
+        inset_area = (slice(self.outline_size, self.outline_size + size[1]), slice(self.outline_size, self.outline_size + size[0]))
+        inset[inset_area] = np.asarray(mask, dtype=np.float32) / 255
+        primary_weight = (1 - outline) * (1 - inset)
+
+        # Pixels where the secondary image is copied or the primary image is
+        # kept as it is do not need blending
+        done = primary_weight == 1
+        done[inset_area] = inset[inset_area] == 1
+        edge = np.flatnonzero(~done)
+        primary_weight = primary_weight.ravel()
+        secondary_weight = inset.ravel()
+        weights = edge, primary_weight[edge, None], secondary_weight[edge, None]
+
+        self._weights[key] = weights
+        if len(self._weights) > self.cache_size:
+            self._weights.popitem(last=False)
+        return weights
+
+    # Function to get the box around the inset and its outline, or None if it does not fit into the image
+    def _box(self, primary_size, inset_size):
+        x, y = self.position
+        left, top = x - self.outline_size, y - self.outline_size
+        right = left + inset_size[0] + 2 * self.outline_size + 1
+        bottom = top + inset_size[1] + 2 * self.outline_size + 1
+        if left < 0 or top < 0 or right > primary_size[0] or bottom > primary_size[1]:
+            return None
+        return (left, top, right, bottom)
+
+    # Function to combine pairs of decoded images, yields (item, combined image) in the order they are done
+    # `pairs` yields (item, primary image, secondary image with the inset
+    # size), see load_secondary and resize_secondary. `item` is passed
+    # through to tell the results apart. Pairs are grouped by their sizes, a
+    # group is blended once `batch_size` pairs came together and the rest at
+    # the end.
+    def combine_batches(self, pairs):
+        groups = {}
+        for item, primary_image, inset_image in pairs:
+            if primary_image.mode != 'RGB':
+                primary_image = primary_image.convert('RGB')
+            key = (primary_image.size, inset_image.size)
+            group = groups.setdefault(key, [])
+            group.append((item, primary_image, inset_image))
+            if len(group) >= self.batch_size:
+                yield from self._combine_group(groups.pop(key))
+        for group in groups.values():
+            yield from self._combine_group(group)
+
+    def _combine_group(self, group):
+        primary_size, inset_size = group[0][1].size, group[0][2].size
+        box = self._box(primary_size, inset_size)
+        np = _import_numpy() if box is not None else None
+        if np is None:
+            for item, primary_image, inset_image in group:
+                yield item, self.combine_inset(primary_image, inset_image)
+            return
+
+        with metrics.stage('combine'):
+            edge, primary_weight, secondary_weight = self._get_weights(inset_size)
+            boxes = np.stack([np.asarray(primary_image.crop(box)) for _, primary_image, _ in group])
+            pixels = boxes.reshape(len(group), -1, 3)  # View of the boxes with one row per pixel
+            primary_edge = pixels[:, edge]
+
+            o = self.outline_size
+            for i, (_, _, inset_image) in enumerate(group):
+                boxes[i, o:o + inset_size[1], o:o + inset_size[0]] = np.asarray(inset_image)
+
+            blended = primary_edge * primary_weight + pixels[:, edge] * secondary_weight
+            pixels[:, edge] = np.rint(blended, out=blended)
+
+        for i, (item, primary_image, _) in enumerate(group):
+            primary_image.paste(Image.fromarray(boxes[i]), box[:2])
+            yield item, primary_image
+
+# Compositor shared by all combined images of this process
+compositor = ImageCompositor()
+
+# Function to combine the decoded primary and secondary image of a post
+def combine_images_with_resizing(primary_image, secondary_image):
+    return compositor.combine(primary_image, secondary_image)
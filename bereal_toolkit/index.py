@@ -0,0 +1,219 @@
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from . import metrics
+from .posts import iter_posts, resolve_entries
+from .sources import ZipMember
+
+logger = logging.getLogger(__name__)
+
+# Index of the posts of an export
+# posts.json is parsed and the images of every post are looked up once. The
+# result is kept in a SQLite database in the output folder, together with the
+# number of images per folder. Later runs read the posts from there as long
+# as the export did not change (see state() in sources.py), without parsing
+# posts.json, scanning the image folders or checking for files. Posts can be
+# selected by date and location, and only the matching rows are read.
+#
+# Several exports processed into the same output folder have their own rows.
+# Paths are stored relative to the export, so the index stays valid when the
+# export is given another way, e.g. as an absolute path or from another folder.
+
+INDEX_NAME = 'posts-index.sqlite'
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+DROP TABLE IF EXISTS exports;
+DROP TABLE IF EXISTS posts;
+CREATE TABLE exports (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    state TEXT NOT NULL,  -- state() of the export when the index was built, as JSON
+    counts TEXT NOT NULL  -- count_images() of the export, as JSON with the folders relative to the export
+);
+CREATE TABLE posts (
+    export_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,  -- position in posts.json
+    key TEXT,  -- path of the primary image in posts.json, as in the manifest
+    taken_at TEXT,  -- ISO format, sorts like the dates
+    sources TEXT,  -- resolved images by role, as JSON with paths relative to the export
+    location TEXT,  -- as JSON, NULL without a location
+    caption TEXT,  -- as JSON, NULL without a caption
+    error TEXT,  -- why the entry could not be resolved, the other columns are NULL then
+    PRIMARY KEY (export_id, idx)
+);
+CREATE INDEX posts_taken_at ON posts (export_id, taken_at);
+"""
+
+
+# Function to describe a resolved image of an export for the index
+def _source_to_json(source, export):
+    if isinstance(source, ZipMember):
+        return {'member': source.member, 'size': source.size, 'mtime_ns': source.mtime_ns}
+    return {'path': Path(source).relative_to(export.path).as_posix()}
+
+def _source_from_json(source, export):
+    if 'member' in source:
+        return ZipMember(str(export.path), source['member'], source['size'], source['mtime_ns'])
+    return export.path / source['path']
+
+# Functions to store the image counts of an export, whose folders start with the path of the export
+def _counts_to_json(counts, export):
+    return json.dumps({folder[len(str(export.path)):]: count for folder, count in counts.items()})
+
+def _counts_from_json(counts, export):
+    return {str(export.path) + folder: count for folder, count in json.loads(counts).items()}
+
+def _json_or_null(value):
+    return None if value is None else json.dumps(value)
+
+
+class PostsIndex:
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._db = sqlite3.connect(self.db_path)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            with self._db:
+                self._db.executescript(SCHEMA + f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _export_path(export):
+        return str(export.path.resolve())
+
+    def _export_row(self, export):
+        return self._db.execute('SELECT id, state, counts FROM exports WHERE path = ?', (self._export_path(export),)).fetchone()
+
+    # Function to check whether the index was built for the export as it is now
+    def is_current(self, export):
+        row = self._export_row(export)
+        return row is not None and json.loads(row[1]) == export.state()
+
+    # Function to parse posts.json and resolve its images into the index
+    # Raises ValueError if posts.json is malformed, the index of the export is
+    # left as it was then.
+    def build(self, export):
+        state = export.state()  # Taken first, a change during the build makes the next run build again
+        with metrics.stage('index'), self._db, export.open_posts() as posts_file:
+            self._db.execute('INSERT OR IGNORE INTO exports (path, state, counts) VALUES (?, ?, ?)', (self._export_path(export), 'null', '{}'))
+            export_id = self._export_row(export)[0]
+            self._db.execute('DELETE FROM posts WHERE export_id = ?', (export_id,))
+            rows = []
+            for index, task, error in resolve_entries(iter_posts(posts_file), export):
+                if task is None:
+                    rows.append((export_id, index, None, None, None, None, None, error))
+                else:
+                    sources = json.dumps({role: _source_to_json(source, export) for role, source in task['sources'].items()})
+                    rows.append((export_id, index, task['key'], task['taken_at'].isoformat(), sources,
+                                 _json_or_null(task['location']), _json_or_null(task['caption']), None))
+                if len(rows) >= 1000:
+                    self._db.executemany('INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                    rows = []
+            self._db.executemany('INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.execute('UPDATE exports SET state = ?, counts = ? WHERE id = ?', (json.dumps(state), _counts_to_json(export.count_images(), export), export_id))
+        logger.info(f"Indexed the posts of {export} in {self.db_path}.")
+
+    # Function to get the number of WebP files per image folder, as counted when the index was built
+    def count_images(self, export):
+        return _counts_from_json(self._export_row(export)[2], export)
+
+    # Function to build the WHERE clause for the posts of an export that match the filters
+    # `since` and `until` are dates, both days are included.
+    def _where(self, export, since=None, until=None, only_with_location=False):
+        conditions = ['export_id = ?']
+        parameters = [self._export_row(export)[0]]
+        if since is not None:
+            conditions.append('taken_at >= ?')
+            parameters.append(since.isoformat())
+        if until is not None:
+            conditions.append('taken_at < ?')
+            parameters.append((until + timedelta(days=1)).isoformat())
+        if only_with_location:
+            conditions.append('location IS NOT NULL')
+        return ' AND '.join(conditions), parameters
+
+    # Function to count the posts of an export that match the filters
+    def count(self, export, since=None, until=None, only_with_location=False):
+        where, parameters = self._where(export, since, until, only_with_location)
+        return self._db.execute(f'SELECT COUNT(*) FROM posts WHERE {where}', parameters).fetchone()[0]
+
+    # Function to read the posts of an export that match the filters, yields (index, task, error) in input order
+    # The tasks are the same as from posts.resolve_entries. Entries that could
+    # not be resolved have no date or location, so they only match without filters.
+    def tasks(self, export, since=None, until=None, only_with_location=False):
+        where, parameters = self._where(export, since, until, only_with_location)
+        cursor = self._db.execute(f'SELECT idx, key, taken_at, sources, location, caption, error FROM posts WHERE {where} ORDER BY idx', parameters)
+        for index, key, taken_at, sources, location, caption, error in cursor:
+            if error is not None:
+                yield index, None, error
+                continue
+            yield index, {
+                'key': key,
+                'sources': {role: _source_from_json(source, export) for role, source in json.loads(sources).items()},
+                'taken_at': datetime.fromisoformat(taken_at),
+                'location': None if location is None else json.loads(location),
+                'caption': None if caption is None else json.loads(caption),
+                'index': index,
+            }, None
+
+
+# Function to open the posts index in an output folder, building it for the export if it is outdated
+# Returns None if the index can not be used, e.g. because posts.json is
+# malformed or the database is damaged. The export is then read directly.
+def open_posts_index(export, output_folder):
+    posts_index = None
+    try:
+        posts_index = PostsIndex(Path(output_folder) / INDEX_NAME)
+        if not posts_index.is_current(export):
+            posts_index.build(export)
+        return posts_index
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning(f"Not using the posts index: {e}")
+        if posts_index is not None:
+            posts_index.close()
+        return None
+
+# Function to count the WebP files per image folder, from the posts index if it is current
+def count_images(export, output_folder):
+    index_path = Path(output_folder) / INDEX_NAME
+    if index_path.exists():
+        try:
+            with PostsIndex(index_path) as posts_index:
+                if posts_index.is_current(export):
+                    return posts_index.count_images(export)
+        except sqlite3.Error:
+            pass
+    return export.count_images()
+
+# Function to check whether a task matches the filters of PostsIndex.tasks
+def matches_filters(task, since=None, until=None, only_with_location=False):
+    if task is None:
+        return since is None and until is None and not only_with_location
+    day = task['taken_at'].date()
+    if since is not None and day < since:
+        return False
+    if until is not None and day > until:
+        return False
+    return not only_with_location or task['location'] is not None
+
+# Function to get the resolved entries of an export that match the filters, yields (index, task, error)
+# Reads them from `posts_index` if given, otherwise from posts.json.
+def select_posts(export, posts_index=None, since=None, until=None, only_with_location=False):
+    if posts_index is not None:
+        yield from posts_index.tasks(export, since, until, only_with_location)
+        return
+    with export.open_posts() as posts_file:
+        for index, task, error in resolve_entries(iter_posts(posts_file), export):
+            if matches_filters(task, since, until, only_with_location):
+                yield index, task, error
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from .files import write_file_atomic
+from .sources import source_hash, source_stat
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FOLDER_NAMES = ('__processed', '__combined', '__previews')
+
+# Function to make a recorded output path absolute
+# Older versions recorded the paths relative to the folder the script was run
+# from, which is not known anymore. The outputs are in the folders next to
+# the manifest, so the path is taken from there.
+def _absolute_output(output, output_dir):
+    if os.path.isabs(output):
+        return output
+    parts = Path(output).parts
+    for i, part in enumerate(parts):
+        if part in OUTPUT_FOLDER_NAMES:
+            return str(output_dir.joinpath(*parts[i:]))
+    return os.path.abspath(output)
+
+# Function to load the manifest of entries processed in earlier runs
+# The manifest is a JSON lines file, later lines win over earlier ones. A line
+# cut off by a crash is ignored, so that entry is simply processed again.
+# Output paths are absolute, see _absolute_output.
+# Before the outputs of an entry are written, a line {'key', 'pending': [outputs]}
+# lists their names. If no record of the entry follows, the run was
+# interrupted, and the outputs may be on disk without a record. These are
+# collected into `pending` by key, if given.
+def load_manifest(manifest_path, pending=None):
+    records = {}
+    if not manifest_path.exists():
+        return records
+    output_dir = Path(os.path.abspath(manifest_path)).parent.parent
+    with open(manifest_path, encoding="utf8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if 'pending' in record:
+                    if pending is not None:
+                        pending[record['key']] = [_absolute_output(output, output_dir) for output in record['pending']]
+                    continue
+                record['outputs'] = [_absolute_output(output, output_dir) for output in record['outputs']]
+                record['settings'].pop('previews', None)  # Listed by older versions, previews do not change the outputs
+                records[record['key']] = record
+                if pending is not None:
+                    pending.pop(record['key'], None)
+            except (ValueError, KeyError, TypeError):
+                logger.error(f"Ignoring damaged line in manifest {manifest_path}.")
+    return records
+
+# Function to write the manifest again without superseded lines, keeping the `pending` outputs
+def save_manifest(manifest_path, records, pending=None):
+    lines = [json.dumps(record) + '\n' for record in records.values()]
+    lines.extend(json.dumps({'key': key, 'pending': outputs}) + '\n' for key, outputs in (pending or {}).items())
+    write_file_atomic(manifest_path, ''.join(lines).encode('utf8'))
+
+# Function to compute the content key of an entry, used to find duplicates
+# Entries with the same key have the same images, metadata and settings, so
+# they would produce the same outputs.
+def content_key(fingerprints, task, settings):
+    content = [
+        [fingerprints[role]['sha256'] for role in sorted(fingerprints)],
+        task['taken_at'].isoformat(),
+        task['location'],
+        task['caption'],
+        settings,
+    ]
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf8')).hexdigest()
+
+# Function to get the key of an entry in the dedup index, the sizes of its images by role
+def size_key(sizes):
+    return tuple(sorted(sizes.items()))
+
+# Function to build the dedup index, which maps the sizes of the images to the entries that hold outputs
+# Entries with the same sizes are only candidates, their content keys tell
+# whether they are duplicates. Sizes are known without reading the images,
+# so only the candidates have to be hashed.
+def build_content_index(records):
+    index = {}
+    for key, record in records.items():
+        if 'content' in record and 'duplicate_of' not in record:
+            sizes = {role: fingerprint['size'] for role, fingerprint in record['sources'].items()}
+            index.setdefault(size_key(sizes), []).append(key)
+    return index
+
+# Function to check whether an entry can be skipped because nothing changed
+# Size and modification time are compared first; the content hash is only
+# computed when they differ, e.g. for a freshly extracted copy of an export.
+# A duplicate entry has no outputs of its own and is only unchanged as long as
+# the entry it duplicates still has its outputs.
+# Source paths are absolute. A relative one was recorded by an older version
+# relative to an unknown folder, it only has to match by name then.
+def entry_is_unchanged(record, sources, settings, records=None):
+    if record is None or record['settings'] != settings:
+        return False
+    for role, path in sources.items():
+        recorded = record['sources'].get(role)
+        if recorded is None:
+            return False
+        if recorded['path'] != str(path):
+            if os.path.isabs(recorded['path']) or Path(recorded['path']).name != path.name:
+                return False
+        try:
+            size, mtime_ns = source_stat(path)
+        except OSError:
+            return False
+        if size != recorded['size']:
+            return False
+        if mtime_ns != recorded['mtime_ns']:
+            if source_hash(path) != recorded['sha256']:
+                return False
+            recorded['mtime_ns'] = mtime_ns
+        recorded['path'] = str(path)
+    if 'duplicate_of' in record:
+        original = (records or {}).get(record['duplicate_of'])
+        if original is None or original.get('content') != record['content'] or not original['outputs']:
+            return False
+        record = original
+    return all(os.path.exists(output) for output in record['outputs'])
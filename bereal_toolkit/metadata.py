@@ -0,0 +1,268 @@
+import logging
+import struct
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+# EXIF and IPTC data are built directly as bytes from the values of a post,
+# without parsing or rewriting an image. The layout is the same as written by
+# piexif.dump and iptcinfo3 before, so readers see exactly the same tags.
+
+# Static IPTC tags
+source_app = "BeReal app"
+processing_tool = "github/bereal-gdpr-photo-toolkit"
+#keywords = ["BeReal"]
+
+# EXIF tags and field types
+TAG_IMAGE_DESCRIPTION = 0x010E
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_GPS_LATITUDE_REF = 0x0001
+TAG_GPS_LATITUDE = 0x0002
+TAG_GPS_LONGITUDE_REF = 0x0003
+TAG_GPS_LONGITUDE = 0x0004
+TYPE_ASCII = 2
+TYPE_LONG = 4
+TYPE_RATIONAL = 5
+
+# IPTC datasets of record 2
+IPTC_RECORD_VERSION = 0
+IPTC_ORIGINATING_PROGRAM = 65
+IPTC_SOURCE = 115
+IPTC_CAPTION = 120
+
+TIFF_HEADER = b"MM\x00\x2a\x00\x00\x00\x08"  # Big endian, first IFD right after the header
+
+# Helper function to convert latitude and longitude to EXIF-friendly format
+def _convert_to_degrees(value):
+    """Convert decimal latitude / longitude to degrees, minutes, seconds (DMS)"""
+    d = int(value)
+    m = int((value - d) * 60)
+    s = (value - d - m/60) * 3600.00
+
+    # Convert to tuples of (numerator, denominator)
+    d = (d, 1)
+    m = (m, 1)
+    s = (int(s * 100), 100)  # Assuming 2 decimal places for seconds for precision
+
+    return (d, m, s)
+
+# Helper functions to create the fields of an IFD as (tag, type, count, data)
+def _ascii_field(tag, value):
+    data = (value.encode('latin1') if isinstance(value, str) else value) + b'\x00'
+    return (tag, TYPE_ASCII, len(data), data)
+
+def _rational_field(tag, values):
+    data = b''.join(struct.pack(">LL", numerator, denominator) for numerator, denominator in values)
+    return (tag, TYPE_RATIONAL, len(values), data)
+
+# Helper function to get the size of an IFD with its values
+def _ifd_length(fields, pointer_count=0, next_ifd=False):
+    values_length = sum(len(data) for _, _, _, data in fields if len(data) > 4)
+    return 2 + 12 * (len(fields) + pointer_count) + 4 * next_ifd + values_length
+
+# Helper function to pack an IFD that starts at `ifd_offset` after the first IFD
+# Fields are sorted by tag, followed by the pointers to sub-IFDs. Values longer
+# than four bytes follow the entries. Like piexif, only the first IFD ends with
+# the (empty) offset of a next IFD.
+def _pack_ifd(fields, ifd_offset, pointers=(), next_ifd=False):
+    entries_length = 2 + 12 * (len(fields) + len(pointers)) + 4 * next_ifd
+    entries = [struct.pack(">H", len(fields) + len(pointers))]
+    values = []
+    values_length = 0
+    for tag, field_type, count, data in sorted(fields):
+        if len(data) <= 4:
+            value = data.ljust(4, b'\x00')
+        else:
+            value = struct.pack(">L", len(TIFF_HEADER) + entries_length + ifd_offset + values_length)
+            values.append(data)
+            values_length += len(data)
+        entries.append(struct.pack(">HHL", tag, field_type, count) + value)
+    for tag, target in pointers:
+        entries.append(struct.pack(">HHLL", tag, TYPE_LONG, 1, len(TIFF_HEADER) + target))
+    if next_ifd:
+        entries.append(b'\x00\x00\x00\x00')
+    return b''.join(entries + values)
+
+# Function to build EXIF data
+def build_exif(datetime_original, location=None, caption=None):
+    try:
+        zeroth_fields = []
+        exif_fields = []
+        gps_fields = []
+
+        # Update datetime original
+        exif_fields.append(_ascii_field(TAG_DATETIME_ORIGINAL, datetime_original.strftime("%Y:%m:%d %H:%M:%S")))
+        datetime_print = datetime_original.strftime("%Y:%m:%d %H:%M:%S")
+        logger.info(f"Found datetime: {datetime_print}")
+        logger.info(f"Added capture date and time.")
+
+        # Update GPS information if location is provided
+        if location and 'latitude' in location and 'longitude' in location:
+            logger.info(f"Found location: {location}")
+            gps_fields = [
+                _ascii_field(TAG_GPS_LATITUDE_REF, 'N' if location['latitude'] >= 0 else 'S'),
+                _rational_field(TAG_GPS_LATITUDE, _convert_to_degrees(abs(location['latitude']))),
+                _ascii_field(TAG_GPS_LONGITUDE_REF, 'E' if location['longitude'] >= 0 else 'W'),
+                _rational_field(TAG_GPS_LONGITUDE, _convert_to_degrees(abs(location['longitude']))),
+            ]
+            logger.info(f"Added GPS location: {location['latitude']}, {location['longitude']}")
+
+        # Transfer caption as title in ImageDescription
+        if caption:
+            logger.info(f"Found caption: {caption}")
+            zeroth_fields.append(_ascii_field(TAG_IMAGE_DESCRIPTION, caption.encode('utf-8')))
+            logger.info(f"Updated title with caption.")
+
+        # The first IFD points to the Exif IFD and the GPS IFD, which follow it
+        zeroth_length = _ifd_length(zeroth_fields, 1 + bool(gps_fields), next_ifd=True)
+        exif_length = _ifd_length(exif_fields)
+        pointers = [(TAG_EXIF_IFD, zeroth_length)]
+        if gps_fields:
+            pointers.append((TAG_GPS_IFD, zeroth_length + exif_length))
+
+        parts = [b"Exif\x00\x00", TIFF_HEADER, _pack_ifd(zeroth_fields, 0, pointers, next_ifd=True), _pack_ifd(exif_fields, zeroth_length)]
+        if gps_fields:
+            parts.append(_pack_ifd(gps_fields, zeroth_length + exif_length))
+        return b''.join(parts)
+    except Exception as e:
+        logger.error(f"Failed to build EXIF data: {e}")
+        return None
+
+# Function to build the IPTC information as a JPEG APP13 segment
+# The IIM datasets are wrapped in a Photoshop 3.0 resource block, which is
+# where readers look for IPTC data in a JPEG.
+def build_iptc_segment(caption):
+    try:
+        datasets = []
+
+        # Update the "Caption-Abstract" field
+        if caption:
+            datasets.append((IPTC_CAPTION, caption))
+            logger.info(f"Caption added to converted image.")
+
+        # Add static IPTC tags and keywords
+        datasets.append((IPTC_SOURCE, source_app))
+        datasets.append((IPTC_ORIGINATING_PROGRAM, processing_tool))
+
+        iim = [struct.pack(">BBBHH", 0x1C, 2, IPTC_RECORD_VERSION, 2, 4)]
+        for dataset, value in datasets:
+            data = value.encode('utf8')
+            iim.append(struct.pack(">BBBH", 0x1C, 2, dataset, len(data)) + data)
+        iim = b''.join(iim)
+
+        # Resource 0x0404 holds the IIM data, padded to an even length
+        resource = b"Photoshop 3.0\x00" + b"8BIM" + b"\x04\x04\x00\x00" + struct.pack(">L", len(iim)) + iim
+        if len(iim) % 2:
+            resource += b'\x00'
+        return b"\xff\xed" + struct.pack(">H", len(resource) + 2) + resource
+    except Exception as e:
+        logger.error(f"Failed to build IPTC Caption-Abstract: {e}")
+        return None
+
+# Helper function to format a coordinate for XMP, e.g. 52,31.2345N
+def _xmp_coordinate(value, positive_ref, negative_ref):
+    degrees = int(abs(value))
+    minutes = (abs(value) - degrees) * 60
+    return f"{degrees},{minutes:.6f}{positive_ref if value >= 0 else negative_ref}"
+
+# Function to build an XMP packet with the same information as the EXIF and IPTC data
+# Used for WebP files that are not converted, either embedded or as sidecar file.
+def build_xmp(datetime_original, location=None, caption=None):
+    try:
+        properties = [
+            f"<exif:DateTimeOriginal>{datetime_original.strftime('%Y-%m-%dT%H:%M:%S')}</exif:DateTimeOriginal>",
+            f"<photoshop:DateCreated>{datetime_original.strftime('%Y-%m-%dT%H:%M:%S')}</photoshop:DateCreated>",
+        ]
+        if location and 'latitude' in location and 'longitude' in location:
+            properties.append(f"<exif:GPSLatitude>{_xmp_coordinate(location['latitude'], 'N', 'S')}</exif:GPSLatitude>")
+            properties.append(f"<exif:GPSLongitude>{_xmp_coordinate(location['longitude'], 'E', 'W')}</exif:GPSLongitude>")
+        if caption:
+            properties.append(f"<dc:description><rdf:Alt><rdf:li xml:lang=\"x-default\">{escape(caption)}</rdf:li></rdf:Alt></dc:description>")
+        properties.append(f"<photoshop:Source>{escape(source_app)}</photoshop:Source>")
+        properties.append(f"<xmp:CreatorTool>{escape(processing_tool)}</xmp:CreatorTool>")
+
+        return (
+            '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+            '<x:xmpmeta xmlns:x="adobe:ns:meta/">\n'
+            '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+            '<rdf:Description rdf:about=""'
+            ' xmlns:dc="http://purl.org/dc/elements/1.1/"'
+            ' xmlns:exif="http://ns.adobe.com/exif/1.0/"'
+            ' xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/"'
+            ' xmlns:xmp="http://ns.adobe.com/xap/1.0/">\n'
+            + ''.join(f" {p}\n" for p in properties) +
+            '</rdf:Description>\n'
+            '</rdf:RDF>\n'
+            '</x:xmpmeta>\n'
+            '<?xpacket end="w"?>'
+        ).encode('utf-8')
+    except Exception as e:
+        logger.error(f"Failed to build XMP data: {e}")
+        return None
+
+# Helper function to split the chunks of a WebP file into (fourcc, payload) pairs
+def _webp_chunks(webp_data):
+    if webp_data[:4] != b'RIFF' or webp_data[8:12] != b'WEBP':
+        raise ValueError("Not a WebP file")
+    chunks = []
+    offset = 12
+    while offset + 8 <= len(webp_data):
+        fourcc = webp_data[offset:offset + 4]
+        size = int.from_bytes(webp_data[offset + 4:offset + 8], 'little')
+        chunks.append((fourcc, webp_data[offset + 8:offset + 8 + size]))
+        offset += 8 + size + (size & 1)
+    return chunks
+
+# Helper function to create the VP8X header chunk of a simple (lossy or lossless) WebP file
+def _webp_extended_header(chunks):
+    for fourcc, payload in chunks:
+        if fourcc == b'VP8 ':
+            width = int.from_bytes(payload[6:8], 'little') & 0x3FFF
+            height = int.from_bytes(payload[8:10], 'little') & 0x3FFF
+            flags = 0
+            break
+        if fourcc == b'VP8L':
+            bits = int.from_bytes(payload[1:5], 'little')
+            width = (bits & 0x3FFF) + 1
+            height = ((bits >> 14) & 0x3FFF) + 1
+            flags = 0x10 if (bits >> 28) & 1 else 0  # Alpha
+            break
+    else:
+        raise ValueError("WebP file has no image data")
+    return bytearray(bytes([flags, 0, 0, 0]) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little'))
+
+# Function to add EXIF and XMP chunks to a WebP file without re-encoding it
+# Simple WebP files are turned into the extended format, which is needed for
+# metadata. Existing EXIF and XMP chunks are replaced.
+def insert_webp_metadata(webp_data, exif_bytes=None, xmp_bytes=None):
+    chunks = [(fourcc, payload) for fourcc, payload in _webp_chunks(webp_data) if fourcc not in (b'EXIF', b'XMP ')]
+    if chunks[0][0] == b'VP8X':
+        header = bytearray(chunks.pop(0)[1])
+    else:
+        header = _webp_extended_header(chunks)
+    header[0] &= ~(0x08 | 0x04) & 0xFF
+
+    # Metadata goes after the image data and before unknown chunks
+    known = (b'ICCP', b'ANIM', b'ANMF', b'ALPH', b'VP8 ', b'VP8L')
+    position = max((i + 1 for i, (fourcc, _) in enumerate(chunks) if fourcc in known), default=len(chunks))
+    metadata = []
+    if exif_bytes:
+        metadata.append((b'EXIF', exif_bytes[6:] if exif_bytes.startswith(b"Exif\x00\x00") else exif_bytes))
+        header[0] |= 0x08
+    if xmp_bytes:
+        metadata.append((b'XMP ', xmp_bytes))
+        header[0] |= 0x04
+    chunks = [(b'VP8X', bytes(header))] + chunks[:position] + metadata + chunks[position:]
+
+    body = b''.join(fourcc + struct.pack("<L", len(payload)) + payload + b'\x00' * (len(payload) & 1) for fourcc, payload in chunks)
+    return b'RIFF' + struct.pack("<L", len(body) + 4) + b'WEBP' + body
+
+# Helper function to insert a segment after the APPn segments of a JPEG
+def _insert_jpeg_segment(jpeg_data, segment):
+    offset = 2  # Skip SOI marker
+    while jpeg_data[offset] == 0xFF and 0xE0 <= jpeg_data[offset + 1] <= 0xEF:
+        segment_length = int.from_bytes(jpeg_data[offset + 2:offset + 4], 'big')
+        offset += 2 + segment_length
+    return jpeg_data[:offset] + segment + jpeg_data[offset:]
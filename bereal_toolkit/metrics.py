@@ -0,0 +1,133 @@
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Metrics of a run: how long every stage of processing took, how many bytes
+# were read and written, and what happened to every entry of posts.json.
+# Every thread records into its current Metrics object, which is swapped
+# per entry with collect(). Workers send the metrics of an entry back to the
+# main process together with its result, where they are merged into the
+# metrics of the run.
+
+# Stages timed by the toolkit
+STAGES = ['read', 'decode', 'exif', 'iptc', 'xmp', 'encode', 'combine', 'preview', 'write', 'copy', 'kernel_copy', 'hardlink', 'reflink', 'hash', 'index', 'prefetch_wait', 'write_wait']
+
+
+class Metrics:
+    def __init__(self):
+        self.durations = {}  # Seconds per call, by stage
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.entries = []  # Outcome of every entry of posts.json
+        self.queue_depths = {}  # Samples of the number of items in a queue, by queue
+
+    def add_duration(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+
+    def add_queue_depth(self, queue, depth):
+        self.queue_depths.setdefault(queue, []).append(depth)
+
+    # Function to record what happened to an entry of posts.json
+    # The outcome is 'processed', 'failed' (some outputs are missing),
+    # 'unchanged' (skipped thanks to the manifest), 'duplicate' (same images and
+    # metadata as another entry) or 'error' (the entry could not be read).
+    def add_entry(self, index, key, outcome, seconds=0.0):
+        self.entries.append({'index': index, 'key': key, 'outcome': outcome, 'ms': round(seconds * 1000, 3)})
+
+    # Function to add the metrics of an entry or a worker to these
+    def merge(self, other):
+        for stage, values in other.durations.items():
+            self.durations.setdefault(stage, []).extend(values)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.entries.extend(other.entries)
+        for queue, depths in other.queue_depths.items():
+            self.queue_depths.setdefault(queue, []).extend(depths)
+
+    def outcomes(self):
+        return dict(Counter(entry['outcome'] for entry in self.entries))
+
+    # Function to summarize the durations of every stage
+    def stage_summary(self):
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        stages = sorted(self.durations, key=lambda stage: order.get(stage, len(order)))
+        return {stage: summarize(self.durations[stage]) for stage in stages}
+
+    # Function to summarize the queue depths, to tune the size of the queues
+    def queue_summary(self):
+        summary = {}
+        for queue, depths in self.queue_depths.items():
+            values = sorted(depths)
+            summary[queue] = {
+                'samples': len(values),
+                'mean': sum(values) / len(values),
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'max': values[-1],
+            }
+        return summary
+
+
+# Function to get the nearest-rank percentile of sorted values
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+# Function to summarize durations in seconds as milliseconds
+def summarize(durations):
+    values = sorted(t * 1000 for t in durations)
+    return {
+        'count': len(values),
+        'total_ms': sum(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+    }
+
+
+# Metrics that stages are currently recorded into, per thread
+_local = threading.local()
+
+# Function to get the metrics that the current thread records into
+def current():
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        metrics = _local.metrics = Metrics()
+    return metrics
+
+# Function to record into `metrics` (a new Metrics object by default) within the block
+# Only the calling thread records into it. Threads that work for an entry,
+# like the writer in pipeline.py, pass the metrics of the entry on.
+@contextmanager
+def collect(metrics=None):
+    previous = current()
+    _local.metrics = metrics if metrics is not None else Metrics()
+    try:
+        yield _local.metrics
+    finally:
+        _local.metrics = previous
+
+# Function to time a stage, used as `with metrics.stage('decode'):`
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current().add_duration(name, time.perf_counter() - start)
+
+def add_duration(name, seconds):
+    current().add_duration(name, seconds)
+
+def add_queue_depth(queue, depth):
+    current().add_queue_depth(queue, depth)
+
+def add_bytes_read(count):
+    current().bytes_read += count
+
+def add_bytes_written(count):
+    current().bytes_written += count
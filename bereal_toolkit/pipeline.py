@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import metrics
+from .sources import read_source
+
+# Staged processing of the entries of an export
+# Reading the sources, decoding/encoding/combining and writing the outputs run
+# in separate threads, so the CPU does not sit idle while the disk (or a
+# network share) is busy:
+#
+#   prefetch_tasks  ->  CPU stage (process_entry)  ->  OutputWriter
+#   reader threads      calling thread                 writer thread
+#
+# Both queues are bounded, so at most `size` entries are held in memory in
+# each of them. Pillow and file I/O release the GIL, so the threads overlap
+# even within one process. The depth of every queue is sampled into the run
+# metrics ('prefetch' and 'write'), together with the time the CPU stage
+# waited for them ('prefetch_wait' and 'write_wait'), to tune the sizes.
+
+
+# Writer for output files, running in a background thread
+# At most `queue_size` writes are queued, submit() blocks while the queue is
+# full. With a queue size of 0 everything is written right away in the
+# calling thread.
+class OutputWriter:
+    def __init__(self, queue_size=4):
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer') if queue_size > 0 else None
+        self._slots = threading.Semaphore(queue_size)
+        self._futures = deque()
+
+    # Function to run fn(*args) in the writer thread
+    # The result of the returned future is the Metrics recorded by the call,
+    # to be merged into the metrics of the entry. Errors are raised by the
+    # future.
+    def submit(self, fn, *args):
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(self._run(fn, args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with metrics.stage('write_wait'):
+            self._slots.acquire()
+        future = self._executor.submit(self._run, fn, args)
+        future.add_done_callback(self._release)
+        while self._futures and self._futures[0].done():
+            self._futures.popleft()
+        self._futures.append(future)
+        metrics.add_queue_depth('write', sum(1 for queued in self._futures if not queued.done()))
+        return future
+
+    @staticmethod
+    def _run(fn, args):
+        with metrics.collect() as job_metrics:
+            fn(*args)
+        return job_metrics
+
+    def _release(self, future):
+        self._slots.release()
+
+    # Function to wait for all queued writes and stop the thread
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Function to read the sources of a task, returns the data by role and the Metrics of the reads
+def read_task_sources(task):
+    with metrics.collect() as read_metrics:
+        data = {role: read_source(path) for role, path in task['sources'].items()}
+    return data, read_metrics
+
+# Function to read the sources of the next `size` tasks ahead in background threads
+# Yields the tasks in order, with the bytes of their images in task['data'].
+# Only tasks for which `needs_data(task)` is true are read ahead. If reading
+# fails, the task is passed on without data and the CPU stage reads the
+# sources itself, so the error is reported with the entry.
+def prefetch_tasks(tasks, size=4, needs_data=None, threads=2):
+    if size <= 0:
+        yield from tasks
+        return
+
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='prefetch')
+    pending = deque()
+    try:
+        for task in tasks:
+            future = executor.submit(read_task_sources, task) if needs_data is None or needs_data(task) else None
+            pending.append((task, future))
+            if len(pending) > size:
+                yield _take_prefetched(pending)
+        while pending:
+            yield _take_prefetched(pending)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+# Function to take the next task from the prefetch queue, waiting for its data if needed
+def _take_prefetched(pending):
+    metrics.add_queue_depth('prefetch', sum(1 for _, future in pending if future is not None and future.done()))
+    task, future = pending.popleft()
+    if future is not None:
+        start = time.perf_counter()
+        try:
+            task['data'], read_metrics = future.result()
+            metrics.current().merge(read_metrics)
+        except Exception:
+            pass
+        metrics.add_duration('prefetch_wait', time.perf_counter() - start)
+    return task
@@ -0,0 +1,106 @@
+import json
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+# Function to read the entries of posts.json one at a time
+# The posts array is parsed incrementally, so only the current entry and one
+# chunk of the file are held in memory, no matter how large the export is.
+# `json_file` is a path or a file opened in text mode.
+def iter_posts(json_file, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    if hasattr(json_file, 'read'):
+        json_context = nullcontext(json_file)
+    else:
+        json_context = open(json_file, encoding="utf8")
+    with json_context as f:
+        buffer = f.read(chunk_size)
+        eof = not buffer
+        position = 0
+        offset = 0  # Position of the buffer within the file, for error messages
+
+        # Function to skip whitespace, reading more of the file when needed
+        def next_char():
+            nonlocal buffer, position, offset, eof
+            while True:
+                while position < len(buffer) and buffer[position].isspace():
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                if eof:
+                    return ''
+                offset += position
+                buffer = f.read(chunk_size)
+                position = 0
+                eof = not buffer
+
+        if next_char() != '[':
+            raise ValueError("posts.json does not contain a list of posts")
+        position += 1
+        if next_char() == ']':
+            return
+
+        while True:
+            # Decode the next entry, reading more of the file until it is complete
+            next_char()
+            while True:
+                try:
+                    entry, end = decoder.raw_decode(buffer, position)
+                    if end < len(buffer) or eof:
+                        break
+                except ValueError:
+                    if eof:
+                        raise ValueError(f"posts.json is malformed at character {offset + position}")
+                more = f.read(chunk_size)
+                if not more:
+                    eof = True
+                buffer = buffer[position:] + more
+                offset += position
+                position = 0
+            position = end
+            yield entry
+
+            # Release everything before the current position
+            offset += position
+            buffer = buffer[position:]
+            position = 0
+
+            separator = next_char()
+            position += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"posts.json is malformed at character {offset + position - 1}")
+
+# Function to resolve the entries of posts.json, yields (index, task, error) in input order
+# `error` describes why an entry could not be resolved, task is None then.
+def resolve_entries(entries, export):
+    for index, entry in enumerate(entries):
+        try:
+            task = resolve_entry(entry, export)
+        except Exception as e:
+            yield index, None, repr(e)
+            continue
+        task['index'] = index
+        yield index, task, None
+
+# Function to resolve the source images and metadata of one entry of posts.json
+# The images are looked up in the index of the export, see sources.py.
+def resolve_entry(entry, export):
+    # Extract only the filename from the path and look it up in the export
+    primary_filename = Path(entry['primary']['path']).name
+    secondary_filename = Path(entry['secondary']['path']).name
+
+    primary_path, secondary_path = export.resolve(primary_filename, secondary_filename)
+
+    taken_at = datetime.strptime(entry['takenAt'], "%Y-%m-%dT%H:%M:%S.%fZ")
+    location = entry.get('location')  # This will be None if 'location' is not present
+    caption = entry.get('caption')  # This will be None if 'caption' is not present
+
+    return {
+        'key': entry['primary']['path'],
+        'sources': {'primary': primary_path, 'secondary': secondary_path},
+        'taken_at': taken_at,
+        'location': location,
+        'caption': caption,
+    }
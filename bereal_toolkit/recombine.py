@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import deque
+from pathlib import Path
+
+from . import metrics
+from .export import ExportFolders, Options, Stats
+from .files import write_file_atomic
+from .imaging import BatchCompositor, encode_webp, load_image
+from .index import open_posts_index, select_posts
+from .manifest import entry_is_unchanged, load_manifest
+from .pipeline import OutputWriter, prefetch_tasks
+from .previews import make_renditions, recorded_sizes, rendition_path
+from .sources import open_export
+
+logger = logging.getLogger(__name__)
+
+# Rendering the combined images again, e.g. after a change to their style
+# Only entries recorded in the manifest are rendered, with the encoder and
+# metadata settings of the run that processed them. Their combined images and
+# its previews are overwritten in place, the singular images and the manifest
+# are left as they are. Entries whose sources changed since are skipped, those
+# need a normal run.
+
+
+# Function to plan the entries whose combined image can be rendered again
+def plan_recombine(posts, folders, manifest, stats):
+    combined_folder = folders.output_folder_combined.resolve()
+    for index, task, error in posts:
+        if task is None:
+            logger.error(f"Error processing entry {index} of posts.json: {error}")
+            continue
+        record = manifest.get(task['key'])
+        if record is None or 'duplicate_of' in record:
+            continue
+        combined_paths = [Path(output) for output in record['outputs'] if Path(output).suffix != '.xmp' and Path(output).resolve().parent == combined_folder]
+        if not combined_paths:
+            continue
+        if not entry_is_unchanged(record, task['sources'], record['settings'], manifest):
+            logger.warning(f"Skipped {task['key']}, it changed since it was processed. Run the script without --recombine first.")
+            stats.skipped += 1
+            continue
+        task['combined_path'] = combined_paths[0]
+        task['options'] = Options(**record['settings'], previews=tuple(recorded_sizes(record)))
+        task['previews_folder'] = folders.previews_folder
+        yield task
+
+# Function to decode the images of the planned entries, yields (task, primary image, inset image)
+def decode_pairs(tasks, compositor, stats):
+    for task in tasks:
+        data = task.pop('data', None) or {}
+        try:
+            primary_image = load_image(task['sources']['primary'], data.get('primary'))
+            inset_image = compositor.load_secondary(task['sources']['secondary'], data.get('secondary'))
+        except Exception as e:
+            logger.error(f"Error decoding the images of {task['key']}: {e}")
+            stats.skipped += 1
+            continue
+        yield task, primary_image, inset_image
+
+# Function to encode a combined image like the run that processed the entry, returns (path, data) of all files
+# These are the combined image and its previews, if the run made previews.
+def encode_combined(task, combined_image):
+    options = task['options']
+    if options.convert_to_jpeg:
+        combined_data = options.get_encoder().encode(combined_image, task['taken_at'], task['location'], task['caption'])
+    else:
+        combined_data = encode_webp(combined_image, task['taken_at'], task['location'], task['caption'], xmp=options.webp_metadata == 'embed')
+    files = [(task['combined_path'], combined_data)]
+    for size, _, rendition_data in make_renditions(combined_image, options.previews):
+        files.append((rendition_path(task['previews_folder'], task['combined_path'], size), rendition_data))
+    return files
+
+def recombine_export(export_dir, output_dir=None, compositor=None, progress=None, prefetch=4, since=None, until=None, only_with_location=False):
+    """Render the combined images of a processed export again and return a Stats object.
+
+    `compositor` is the BatchCompositor with the new style, by default one
+    with the default style. `export_dir` and `output_dir` are the same as for
+    process_export, `since`, `until` and `only_with_location` select posts
+    like the Options of the same name. `progress` is called as
+    progress(done, total) after every combined image. Raises
+    FileNotFoundError if the export has no posts.json.
+    """
+    start = time.perf_counter()
+    compositor = compositor or BatchCompositor()
+    export = open_export(export_dir)
+    folders = ExportFolders.from_dirs(export_dir, output_dir)
+    if not export.has_posts():
+        raise FileNotFoundError(f"JSON file not found in {export}")
+
+    manifest = load_manifest(folders.output_folder / 'manifest.jsonl')
+    if not manifest:
+        logger.warning(f"No processed entries found in {folders.output_folder}.")
+
+    stats = Stats()
+    with OutputWriter(prefetch) as writer, metrics.collect(stats.metrics):
+        posts_index = open_posts_index(export, folders.output_folder) if folders.output_folder.exists() else None
+        if posts_index is not None:
+            total = posts_index.count(export, since, until, only_with_location)
+        else:
+            total = sum(1 for record in manifest.values() if 'duplicate_of' not in record)
+        posts = select_posts(export, posts_index, since, until, only_with_location)
+        tasks = prefetch_tasks(plan_recombine(posts, folders, manifest, stats), prefetch)
+        writes = deque()
+
+        # Function to take finished writes from the queue, waiting for all of them if `wait` is set
+        def collect_writes(wait=False):
+            while writes and (wait or all(future.done() for future in writes[0][1])):
+                task, futures = writes.popleft()
+                try:
+                    for future in futures:
+                        stats.metrics.merge(future.result())
+                    stats.combined += 1
+                except Exception as e:
+                    logger.error(f"Error writing combined image {task['combined_path']}: {e}")
+                    stats.skipped += 1
+
+        try:
+            for task, combined_image in compositor.combine_batches(decode_pairs(tasks, compositor, stats)):
+                try:
+                    files = encode_combined(task, combined_image)
+                    writes.append((task, [writer.submit(write_file_atomic, path, data) for path, data in files]))
+                    logger.info(f"Combined image rendered again: {task['combined_path']}")
+                except Exception as e:
+                    logger.error(f"Error creating combined image {task['combined_path']}: {e}")
+                    stats.skipped += 1
+                collect_writes()
+                if progress is not None:
+                    done = stats.combined + stats.skipped + len(writes)
+                    progress(done, max(done, total))
+        except ValueError as e:
+            logger.error(f"Stopped reading posts.json: {e}")
+        finally:
+            if posts_index is not None:
+                posts_index.close()
+        collect_writes(wait=True)
+
+    if progress is not None:
+        progress(stats.combined + stats.skipped, stats.combined + stats.skipped)
+    stats.seconds = time.perf_counter() - start
+    return stats
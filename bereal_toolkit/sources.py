@@ -0,0 +1,307 @@
+import hashlib
+import io
+import os
+import shutil
+import sys
+import time
+import zipfile
+from functools import cached_property
+from pathlib import Path, PurePosixPath
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# An export is either the unzipped folder or the ZIP file as it comes from
+# BeReal. Both build an index of their images once, so looking up the images
+# of a post does not touch the file system. Images are passed around as a
+# Path (unzipped) or a ZipMember (ZIP), and the functions below work with both.
+
+# Image inside an export ZIP
+# Only the archive path and member name are stored, so members can be sent to
+# worker processes, which open the archive themselves.
+class ZipMember:
+    def __init__(self, zip_path, member, size, mtime_ns):
+        self.zip_path = zip_path
+        self.member = member
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @property
+    def name(self):
+        return PurePosixPath(self.member).name
+
+    @property
+    def stem(self):
+        return PurePosixPath(self.member).stem
+
+    @property
+    def suffix(self):
+        return PurePosixPath(self.member).suffix
+
+    def open(self):
+        return _get_archive(self.zip_path).open(self.member)
+
+    def __str__(self):
+        return f"{self.zip_path}:{self.member}"
+
+    def __repr__(self):
+        return f"ZipMember({str(self)!r})"
+
+# Archives opened by this process
+# A forked worker process starts without them. An inherited ZipFile shares
+# its file offset with the parent and the other workers, so their reads would
+# mix up each other's data.
+_archives = {}
+
+if hasattr(os, 'register_at_fork'):  # Not available on Windows, where workers are never forked
+    os.register_at_fork(after_in_child=_archives.clear)
+
+def _get_archive(zip_path):
+    archive = _archives.get(zip_path)
+    if archive is None:
+        archive = _archives[zip_path] = zipfile.ZipFile(zip_path)
+    return archive
+
+# Function to open an image of an export for reading
+def open_source(source):
+    if isinstance(source, ZipMember):
+        return source.open()
+    return open(source, 'rb')
+
+# Function to read an image of an export into memory
+def read_source(source):
+    with metrics.stage('read'), open_source(source) as f:
+        data = f.read()
+    metrics.add_bytes_read(len(data))
+    return data
+
+# Function to get size and modification time of an image of an export
+def source_stat(source):
+    if isinstance(source, ZipMember):
+        return source.size, source.mtime_ns
+    stat = os.stat(source)
+    return stat.st_size, stat.st_mtime_ns
+
+# Function to compute a content hash of an image of an export
+# With `data`, the image that was already read is hashed instead.
+def source_hash(source, data=None):
+    if data is not None:
+        with metrics.stage('hash'):
+            return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with metrics.stage('hash'), open_source(source) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+            metrics.add_bytes_read(len(chunk))
+    return digest.hexdigest()
+
+# Function to describe an image of an export for the manifest, the content hash is computed unless given
+def source_fingerprint(source, sha256=None):
+    size, mtime_ns = source_stat(source)
+    return {'path': str(source), 'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256 or source_hash(source)}
+
+# ioctl to clone a file on Linux file systems with reflink support (Btrfs, XFS)
+FICLONE = 0x40049409 if fcntl is not None and sys.platform.startswith('linux') else None
+
+# Function to clone a file, returns the method used or None if the file system can not do it
+# FICLONE shares the data blocks between both files ('reflink'). Otherwise
+# copy_file_range at least copies inside the kernel ('kernel_copy'), and
+# clones on some file systems as well.
+def _clone_file(source, destination):
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            cloned = False
+            if FICLONE is not None:
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    cloned = True
+                except OSError:
+                    pass
+            if not cloned:
+                if not hasattr(os, 'copy_file_range'):
+                    raise OSError("copy_file_range is not available")
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        raise OSError("copy_file_range stopped early")
+                    remaining -= copied
+        shutil.copystat(source, destination)
+        return 'reflink' if cloned else 'kernel_copy'
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        return None
+
+# Function to copy an image of an export, keeping its modification time
+# With link='hardlink' the output is a hard link to the image of the export,
+# with link='reflink' a clone of it. Both use no extra disk space; where the
+# file system does not support them the next option is tried, down to a plain
+# copy. The output replaces `destination` at once, so writing an output never
+# changes a file it was hard-linked to before. Returns the method used.
+def copy_source(source, destination, link='copy'):
+    start = time.perf_counter()
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    try:
+        method = 'copy'
+        if isinstance(source, ZipMember):
+            with source.open() as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.utime(tmp_path, ns=(source.mtime_ns, source.mtime_ns))
+        else:
+            if link == 'hardlink':
+                try:
+                    os.link(source, tmp_path)
+                    method = 'hardlink'
+                except OSError:
+                    pass
+            if method == 'copy' and link in ('hardlink', 'reflink'):
+                method = _clone_file(source, tmp_path) or 'copy'
+            if method == 'copy':
+                shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    metrics.add_duration(method, time.perf_counter() - start)
+
+    if method in ('copy', 'kernel_copy'):
+        size = source_stat(source)[0]
+        metrics.add_bytes_read(size)
+        metrics.add_bytes_written(size)
+    return method
+
+
+# Function to get size and modification time of a file or folder, None if it does not exist
+def _stat_or_none(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# Unzipped export
+# The image folders are only scanned when an image is looked up or counted,
+# which a run with a current posts index (see index.py) does not need.
+class DirectoryExport:
+    def __init__(self, export_dir):
+        self.path = Path(export_dir)
+        self.posts_path = self.path / 'posts.json'
+        self.photo_folder = self.path / 'Photos' / 'post'
+        self.bereal_folder = self.path / 'Photos' / 'bereal'
+
+    @cached_property
+    def _photo_index(self):
+        return self._scan(self.photo_folder)
+
+    @cached_property
+    def _bereal_index(self):
+        return self._scan(self.bereal_folder)
+
+    # Function to list the files of a folder with a single directory scan
+    @staticmethod
+    def _scan(folder):
+        try:
+            with os.scandir(folder) as entries:
+                return {entry.name: Path(entry.path) for entry in entries if entry.is_file()}
+        except FileNotFoundError:
+            return {}
+
+    def has_posts(self):
+        return self.posts_path.exists()
+
+    def open_posts(self):
+        return open(self.posts_path, encoding="utf8")
+
+    # Function to find the images of a post
+    # Images are looked up in Photos/post first and in the older Photos/bereal
+    # second. Missing images resolve to Photos/post and fail when read.
+    def resolve(self, primary_filename, secondary_filename):
+        for index, folder in ((self._photo_index, self.photo_folder), (self._bereal_index, self.bereal_folder)):
+            if primary_filename in index:
+                return index[primary_filename], index.get(secondary_filename, folder / secondary_filename)
+        return self.photo_folder / primary_filename, self.photo_folder / secondary_filename
+
+    # Function to count the WebP files per image folder
+    def count_images(self):
+        counts = {str(self.photo_folder): sum(1 for name in self._photo_index if name.endswith('.webp'))}
+        if self.bereal_folder.exists():
+            counts[str(self.bereal_folder)] = sum(1 for name in self._bereal_index if name.endswith('.webp'))
+        return counts
+
+    # Function to describe the state of posts.json and the image folders
+    # Adding, removing or renaming images changes the modification time of
+    # their folder, so a posts index built for another state is outdated.
+    def state(self):
+        return [_stat_or_none(self.posts_path), _stat_or_none(self.photo_folder), _stat_or_none(self.bereal_folder)]
+
+    def __str__(self):
+        return str(self.path)
+
+
+# Export ZIP, read without extracting it
+class ZipExport:
+    def __init__(self, zip_path):
+        self.path = Path(zip_path)
+        self._archive = _get_archive(str(self.path))
+        self._posts_member = None
+        self._photo_index = {}
+        self._bereal_index = {}
+
+        # The export may be wrapped in a top-level folder, so members are
+        # matched by the end of their path
+        for info in self._archive.infolist():
+            if info.is_dir():
+                continue
+            parts = PurePosixPath(info.filename).parts
+            if parts[-1] == 'posts.json':
+                if self._posts_member is None or len(parts) < len(PurePosixPath(self._posts_member).parts):
+                    self._posts_member = info.filename
+            elif len(parts) >= 3 and parts[-3] == 'Photos' and parts[-2] in ('post', 'bereal'):
+                mtime_ns = int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)
+                member = ZipMember(str(self.path), info.filename, info.file_size, mtime_ns)
+                index = self._photo_index if parts[-2] == 'post' else self._bereal_index
+                index[parts[-1]] = member
+
+    def has_posts(self):
+        return self._posts_member is not None
+
+    def open_posts(self):
+        return io.TextIOWrapper(self._archive.open(self._posts_member), encoding="utf8")
+
+    # Function to find the images of a post, see DirectoryExport.resolve
+    def resolve(self, primary_filename, secondary_filename):
+        for index in (self._photo_index, self._bereal_index):
+            if primary_filename in index and secondary_filename in index:
+                return index[primary_filename], index[secondary_filename]
+        raise FileNotFoundError(f"{primary_filename} and {secondary_filename} not found in {self.path}")
+
+    # Function to count the WebP files per image folder
+    def count_images(self):
+        counts = {f"{self.path}:Photos/post": sum(1 for name in self._photo_index if name.endswith('.webp'))}
+        if self._bereal_index:
+            counts[f"{self.path}:Photos/bereal"] = sum(1 for name in self._bereal_index if name.endswith('.webp'))
+        return counts
+
+    # Function to describe the state of the archive, see DirectoryExport.state
+    def state(self):
+        return [_stat_or_none(self.path)]
+
+    def __str__(self):
+        return str(self.path)
+
+
+# Function to open an export, either the unzipped folder or the ZIP file
+# The path is made absolute, so the images of the export are recorded the
+# same way no matter which folder the script is run from.
+def open_export(export_path):
+    export_path = Path(os.path.abspath(export_path))
+    if export_path.is_file() and zipfile.is_zipfile(export_path):
+        return ZipExport(export_path)
+    return DirectoryExport(export_path)
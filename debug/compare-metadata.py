@@ -0,0 +1,85 @@
+import argparse
+import io
+import random
+import string
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import piexif
+from iptcinfo3 import IPTCInfo
+
+# Check that the EXIF and IPTC data built by bereal_toolkit.metadata are
+# byte-identical to what piexif.dump and iptcinfo3 wrote before, for random
+# dates, locations and captions. Needs piexif and iptcinfo3 installed.
+#
+# Usage: python debug/compare-metadata.py [--count 3000] [--seed 0]
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bereal_toolkit.metadata import (  # noqa: E402
+    _convert_to_degrees, build_exif, build_iptc_segment, processing_tool, source_app)
+
+
+# Function to build EXIF data the way it was done with piexif
+def piexif_exif(datetime_original, location=None, caption=None):
+    exif_dict = {'0th': {}, 'Exif': {}, 'GPS': {}}
+    exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal] = datetime_original.strftime("%Y:%m:%d %H:%M:%S")
+    if location and 'latitude' in location and 'longitude' in location:
+        exif_dict['GPS'] = {
+            piexif.GPSIFD.GPSLatitudeRef: 'N' if location['latitude'] >= 0 else 'S',
+            piexif.GPSIFD.GPSLatitude: _convert_to_degrees(abs(location['latitude'])),
+            piexif.GPSIFD.GPSLongitudeRef: 'E' if location['longitude'] >= 0 else 'W',
+            piexif.GPSIFD.GPSLongitude: _convert_to_degrees(abs(location['longitude'])),
+        }
+    if caption:
+        exif_dict['0th'][piexif.ImageIFD.ImageDescription] = caption.encode('utf-8')
+    return piexif.dump(exif_dict)
+
+
+# Function to build the IPTC segment the way it was done with iptcinfo3
+def iptcinfo_segment(caption):
+    info = IPTCInfo(io.BytesIO(b'\xff\xd8\xff\xd9'), force=True)
+    if caption:
+        info['caption/abstract'] = caption
+    info['source'] = source_app
+    info['originating program'] = processing_tool
+    return info.photoshopIIMBlock(None, info.packedIIMData())
+
+
+# Function to create a random post: date, optional location and caption
+def random_post(rng):
+    datetime_original = datetime(2022, 1, 1) + timedelta(seconds=rng.randrange(4 * 365 * 24 * 3600))
+    location = None
+    if rng.random() < 0.7:
+        location = {'latitude': rng.uniform(-90, 90), 'longitude': rng.uniform(-180, 180)}
+    caption = None
+    if rng.random() < 0.6:
+        alphabet = string.ascii_letters + string.digits + " .,!?éüß😀"
+        caption = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(1, 120)))
+    return datetime_original, location, caption
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the metadata builders with piexif and iptcinfo3.")
+    parser.add_argument('--count', type=int, default=3000, help="Number of random posts")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random posts")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = 0
+    for i in range(args.count):
+        datetime_original, location, caption = random_post(rng)
+        if build_exif(datetime_original, location, caption) != piexif_exif(datetime_original, location, caption):
+            print(f"EXIF differs for post {i}: {datetime_original}, {location}, {caption!r}")
+            failures += 1
+        if build_iptc_segment(caption) != iptcinfo_segment(caption):
+            print(f"IPTC differs for post {i}: {caption!r}")
+            failures += 1
+
+    print(f"{args.count} posts compared, {failures} differences")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()